@@ -0,0 +1,260 @@
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# Alert directions: fire when the price rises to / falls to the target
+ABOVE = 'above'
+BELOW = 'below'
+DIRECTIONS = (ABOVE, BELOW)
+
+# Per-symbol columns: alert ids, chat ids and target prices, sorted by target
+Block = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class AlertIndex:
+    """In-memory two-sided alert index held as columnar NumPy arrays.
+
+    Each symbol owns, per direction, three parallel arrays sorted by target.
+    Alerts above fire on a prefix of the above side (target <= high) and
+    alerts below on a suffix of the below side (target >= low), so one
+    searchsorted per side (O(log n)) plus a slice finds every fired alert.
+    An alert costs 24 bytes instead of a tuple of boxed Python numbers.
+    Writes replace a symbol's arrays rather than mutating them, and come from
+    the DB worker thread, so access is guarded by a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # direction -> symbol -> block
+        self._sides: Dict[str, Dict[str, Block]] = {direction: {} for direction in DIRECTIONS}
+        self._size = 0
+        # Symbols with alerts added or moved since the poll scheduler last looked
+        self._dirty: Set[str] = set()
+        # symbol -> alert ids added or moved since the symbol was last evaluated
+        self._armed: Dict[str, Set[int]] = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._size
+
+    def load(self, rows: Iterable[Tuple]):
+        """Rebuild the index from (alert_id, chat_id, symbol, target_price, direction) rows.
+
+        Rows are streamed into typed arrays, so a cursor can be passed directly
+        without materialising a million tuples first.
+        """
+        ids, chats, targets, codes = array('q'), array('q'), array('d'), array('l')
+        groups: Dict[Tuple[str, str], int] = {}
+        for alert_id, chat_id, symbol, target_price, direction in rows:
+            ids.append(alert_id)
+            chats.append(chat_id)
+            targets.append(target_price)
+            codes.append(groups.setdefault((direction, symbol), len(groups)))
+
+        ids = np.frombuffer(ids, dtype=np.int64)
+        chats = np.frombuffer(chats, dtype=np.int64)
+        targets = np.frombuffer(targets, dtype=np.float64)
+        codes = np.frombuffer(codes, dtype=np.int_)
+
+        # Group by (direction, symbol), then sort each group by target
+        order = np.lexsort((targets, codes))
+        bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1))
+
+        sides = {direction: {} for direction in DIRECTIONS}
+        for (direction, symbol), code in groups.items():
+            rows_of_group = order[bounds[code]:bounds[code + 1]]
+            sides[direction][symbol] = (ids[rows_of_group], chats[rows_of_group], targets[rows_of_group])
+
+        with self._lock:
+            self._sides = sides
+            self._size = len(ids)
+
+    def symbols(self) -> List[str]:
+        """Symbols that currently have at least one alert"""
+        with self._lock:
+            return list(dict.fromkeys(symbol for side in self._sides.values() for symbol in side))
+
+    def get(self, chat_id: int, symbol: str) -> Optional[Tuple[int, float, str]]:
+        """Return (alert_id, target_price, direction) for this user's alert on symbol"""
+        with self._lock:
+            for direction, side in self._sides.items():
+                block = side.get(symbol)
+                if block is None:
+                    continue
+                ids, chats, targets = block
+                found = np.flatnonzero(chats == chat_id)
+                if found.size:
+                    return int(ids[found[0]]), float(targets[found[0]]), direction
+            return None
+
+    def add(self, alert_id: int, chat_id: int, symbol: str, target_price: float, direction: str = ABOVE):
+        """Insert an alert keeping the symbol's targets sorted"""
+        with self._lock:
+            side = self._sides[direction]
+            block = side.get(symbol)
+            if block is None:
+                side[symbol] = (
+                    np.array([alert_id], dtype=np.int64),
+                    np.array([chat_id], dtype=np.int64),
+                    np.array([target_price], dtype=np.float64),
+                )
+            else:
+                ids, chats, targets = block
+                pos = np.searchsorted(targets, target_price, side='right')
+                side[symbol] = (
+                    np.insert(ids, pos, alert_id),
+                    np.insert(chats, pos, chat_id),
+                    np.insert(targets, pos, target_price),
+                )
+            self._size += 1
+            self._dirty.add(symbol)
+            self._armed.setdefault(symbol, set()).add(alert_id)
+
+    def remove(self, chat_id: int, symbol: str) -> bool:
+        """Drop this user's alert on symbol, if any"""
+        with self._lock:
+            removed = 0
+            for side in self._sides.values():
+                block = side.get(symbol)
+                if block is not None:
+                    removed += self._drop(side, symbol, block, block[1] != chat_id)
+            return removed > 0
+
+    def remove_ids(self, symbol: str, alert_ids: Iterable[int]) -> int:
+        """Drop many alerts of one symbol at once - one mask per side instead of one per alert"""
+        alert_ids = np.fromiter(alert_ids, dtype=np.int64)
+        with self._lock:
+            removed = 0
+            for side in self._sides.values():
+                block = side.get(symbol)
+                if block is not None:
+                    removed += self._drop(side, symbol, block, ~np.isin(block[0], alert_ids))
+            return removed
+
+    def update(self, chat_id: int, symbol: str, new_price: float, direction: str = ABOVE) -> bool:
+        """Move this user's alert on symbol to a new target and direction"""
+        with self._lock:
+            found = self.get(chat_id, symbol)
+            if found is None:
+                return False
+
+            alert_id = found[0]
+            self.remove(chat_id, symbol)
+            self.add(alert_id, chat_id, symbol, new_price, direction)
+            return True
+
+    def remove_chat(self, chat_id: int) -> int:
+        """Drop every alert of a user"""
+        with self._lock:
+            removed = 0
+            for side in self._sides.values():
+                for symbol, block in list(side.items()):
+                    keep = block[1] != chat_id
+                    if not keep.all():
+                        removed += self._drop(side, symbol, block, keep)
+            return removed
+
+    def triggered(self, symbol: str, high: float, low: Optional[float] = None,
+                  price: Optional[float] = None) -> List[Tuple[int, int, float, str]]:
+        """Return (alert_id, chat_id, target_price, direction) for alerts crossed by the range.
+
+        Alerts above fire when target <= high, alerts below when target >= low;
+        low defaults to high for a single price. Given the current price, alerts
+        added or moved since the symbol's last such call are checked against
+        that price only, as the range may have been traded before they existed.
+        """
+        low = high if low is None else low
+        with self._lock:
+            above = self._sides[ABOVE].get(symbol)
+            below = self._sides[BELOW].get(symbol)
+            armed = self._armed.pop(symbol, None) if price is not None else None
+
+        fired = []
+        if above is not None:
+            ids, chats, targets = above
+            end = np.searchsorted(targets, high, side='right')
+            fired.extend(zip(ids[:end].tolist(), chats[:end].tolist(), targets[:end].tolist(), [ABOVE] * end))
+        if below is not None:
+            ids, chats, targets = below
+            start = np.searchsorted(targets, low, side='left')
+            count = len(targets) - start
+            fired.extend(zip(ids[start:].tolist(), chats[start:].tolist(), targets[start:].tolist(), [BELOW] * count))
+        if armed:
+            fired = [
+                alert for alert in fired
+                if alert[0] not in armed or (alert[2] <= price if alert[3] == ABOVE else alert[2] >= price)
+            ]
+        return fired
+
+    def nearest(self, symbol: str, high: float, low: Optional[float] = None) -> Tuple[Optional[float], Optional[float]]:
+        """Next unfired targets on each side: (lowest above high, highest below low)"""
+        low = high if low is None else low
+        with self._lock:
+            above = self._sides[ABOVE].get(symbol)
+            below = self._sides[BELOW].get(symbol)
+
+        next_above = next_below = None
+        if above is not None:
+            targets = above[2]
+            pos = np.searchsorted(targets, high, side='right')
+            if pos < len(targets):
+                next_above = float(targets[pos])
+        if below is not None:
+            targets = below[2]
+            pos = np.searchsorted(targets, low, side='left')
+            if pos > 0:
+                next_below = float(targets[pos - 1])
+        return next_above, next_below
+
+    def apply(self, changes: Iterable[Tuple]) -> int:
+        """Replay (alert_id, chat_id, symbol, target_price, direction, deleted) changes.
+
+        Idempotent: a change this process already applied through its own
+        write is skipped, so another process's change log can be replayed
+        in full. Returns how many changes altered the index.
+        """
+        applied = 0
+        with self._lock:
+            for alert_id, chat_id, symbol, target_price, direction, deleted in changes:
+                existing = self.get(chat_id, symbol)
+                if deleted:
+                    if existing is not None and existing[0] == alert_id:
+                        self.remove(chat_id, symbol)
+                        applied += 1
+                elif existing != (alert_id, target_price, direction):
+                    if existing is not None:
+                        self.remove(chat_id, symbol)
+                    self.add(alert_id, chat_id, symbol, target_price, direction)
+                    applied += 1
+        return applied
+
+    def retain_armed(self, symbols: Iterable[str]):
+        """Forget armed alerts of every other symbol - ones this process never evaluates"""
+        symbols = set(symbols)
+        with self._lock:
+            for symbol in [s for s in self._armed if s not in symbols]:
+                del self._armed[symbol]
+
+    def take_dirty(self) -> Set[str]:
+        """Symbols whose alerts changed since the last call"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return dirty
+
+    def _drop(self, side: Dict[str, Block], symbol: str, block: Block, keep: np.ndarray) -> int:
+        removed = len(keep) - int(np.count_nonzero(keep))
+        if not removed:
+            return 0
+        if removed == len(keep):
+            del side[symbol]
+        else:
+            side[symbol] = tuple(column[keep] for column in block)
+        self._size -= removed
+        armed = self._armed.get(symbol)
+        if armed:
+            armed.difference_update(block[0][~keep].tolist())
+            if not armed:
+                del self._armed[symbol]
+        return removed
@@ -0,0 +1,111 @@
+import bisect
+from array import array
+from typing import Dict, Optional
+
+
+class Bars:
+    """Compact OHLCV series for one symbol, oldest bar first.
+
+    Backed by typed arrays instead of the decoded JSON lists, so a cached
+    series costs 8 bytes per field per bar rather than a Python float each.
+    """
+
+    __slots__ = ('symbol', 't', 'o', 'h', 'l', 'c', 'v')
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.t = array('q')
+        self.o = array('d')
+        self.h = array('d')
+        self.l = array('d')
+        self.c = array('d')
+        self.v = array('d')
+
+    @classmethod
+    def from_json(cls, symbol: str, data: Optional[Dict]) -> Optional['Bars']:
+        """Parse a Vietstock history payload: {t: [...], o: [...], h, l, c, v}"""
+        if not data or not data.get('c'):
+            return None
+
+        bars = cls(symbol)
+        try:
+            bars.t.extend(int(x) for x in data['t'])
+            bars.o.extend(float(x) for x in data['o'])
+            bars.h.extend(float(x) for x in data['h'])
+            bars.l.extend(float(x) for x in data['l'])
+            bars.c.extend(float(x) for x in data['c'])
+            bars.v.extend(float(x) for x in data['v'])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"🔍 DEBUG: Malformed bars for {symbol}: {e}")
+            return None
+
+        if not (len(bars.t) == len(bars.o) == len(bars.h) == len(bars.l) == len(bars.c) == len(bars.v)):
+            print(f"🔍 DEBUG: Mismatched bar arrays for {symbol}")
+            return None
+        return bars
+
+    def __len__(self) -> int:
+        return len(self.c)
+
+    def closed_until(self, session_start: int) -> Optional[int]:
+        """Timestamp of the newest bar that closed before session_start, if any"""
+        pos = bisect.bisect_left(self.t, session_start)
+        return self.t[pos - 1] if pos else None
+
+    def reference(self, session_start: int) -> Optional[float]:
+        """Previous session's close, which the daily price limits are computed from"""
+        pos = bisect.bisect_left(self.t, session_start)
+        return self.c[pos - 1] if pos else None
+
+    def volatility(self) -> Optional[float]:
+        """Mean daily range (high - low) / close over the stored bars"""
+        ranges = [(h - l) / c for h, l, c in zip(self.h, self.l, self.c) if c]
+        return sum(ranges) / len(ranges) if ranges else None
+
+    def merged(self, newer: 'Bars', keep: int) -> 'Bars':
+        """New series: our bars older than newer's first bar, then newer, capped to keep bars"""
+        cut = bisect.bisect_left(self.t, newer.t[0]) if len(newer) else len(self)
+        start = max(0, cut + len(newer) - keep)
+
+        bars = Bars(self.symbol)
+        for field in ('t', 'o', 'h', 'l', 'c', 'v'):
+            column = getattr(bars, field)
+            column.extend(getattr(self, field)[start:cut])
+            column.extend(getattr(newer, field)[max(0, start - cut):])
+        return bars
+
+    @property
+    def close(self) -> float:
+        """Latest close (the current price during the session)"""
+        return self.c[-1]
+
+    def info(self) -> Dict:
+        """Summary of the latest bar, as returned by PriceChecker.get_stock_info"""
+        close_price = self.c[-1]
+        open_price = self.o[-1]
+
+        # Calculate change
+        change = close_price - open_price
+        change_percent = (change / open_price * 100) if open_price else 0
+
+        return {
+            'symbol': self.symbol,
+            'price': close_price,
+            'change': change,
+            'change_percent': change_percent,
+            'volume': int(self.v[-1]),
+            'high': self.h[-1],
+            'low': self.l[-1],
+        }
+
+
+class Quote:
+    """Current price plus the high/low traded since the previous poll of the symbol"""
+
+    __slots__ = ('symbol', 'price', 'high', 'low')
+
+    def __init__(self, symbol: str, price: float, high: float, low: float):
+        self.symbol = symbol
+        self.price = price
+        self.high = high
+        self.low = low
@@ -0,0 +1,343 @@
+"""Offline benchmark for the alert check cycle.
+
+Starts a local stand-in for the Vietstock history API, seeds a throwaway
+alerts DB with N alerts and runs check_alerts against a fake Telegram bot.
+
+    python benchmark.py                              # 1k, 10k, 100k alerts
+    python benchmark.py --alerts 10000 --latency 50 --error-rate 0.02 --throttle-rate 0.05
+    python benchmark.py --json results.json          # save results
+    python benchmark.py --baseline results.json      # fail if cycle time regressed
+
+Each size runs in its own process so peak RSS and the DB singleton are per size.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from aiohttp import web
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class FakeVietstock:
+    """Local aiohttp stand-in for config.VIETSTOCK_API_URL with injectable latency and errors"""
+
+    def __init__(self, latency_ms: float = 20, error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 seed: int = 42):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.prices: Dict[str, List[float]] = {}  # symbol -> [open, high, low, close]
+        self.requests = 0
+        self.status_counts: Dict[int, int] = {}
+        self._runner = None
+        self.url = None
+
+    def base_price(self, symbol: str) -> float:
+        return round(10 + zlib.crc32(symbol.encode()) % 9000 / 100, 1)
+
+    def _bars(self, symbol: str, from_ts: int, countback: int) -> Dict:
+        now = datetime.now(timezone.utc)
+        vn_midnight = (now + timedelta(hours=7)).replace(hour=0, minute=0, second=0, microsecond=0)
+        today = int((vn_midnight - timedelta(hours=7)).timestamp())
+
+        bar = self.prices.get(symbol)
+        if bar is None:
+            p0 = self.base_price(symbol)
+            bar = self.prices[symbol] = [p0, p0, p0, p0]
+        # Random walk the live bar a little on every request
+        bar[3] = round(max(0.1, bar[3] * (1 + self.random.uniform(-0.005, 0.005))), 2)
+        bar[1] = max(bar[1], bar[3])
+        bar[2] = min(bar[2], bar[3])
+
+        times = [t for t in (today - 86400 * k for k in range(60, -1, -1)) if t >= from_ts][-countback:]
+        if not times:
+            return {'s': 'no_data'}
+        closed = len(times) - 1 if times[-1] == today else len(times)
+        p0 = bar[0]
+        return {
+            's': 'ok',
+            't': times,
+            'o': [p0] * closed + ([bar[0]] if closed < len(times) else []),
+            'h': [p0 * 1.02] * closed + ([bar[1]] if closed < len(times) else []),
+            'l': [p0 * 0.98] * closed + ([bar[2]] if closed < len(times) else []),
+            'c': [p0] * closed + ([bar[3]] if closed < len(times) else []),
+            'v': [100000] * len(times),
+        }
+
+    async def handle_history(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.random.expovariate(1 / self.latency))
+
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            status, response = 429, web.Response(status=429, headers={'Retry-After': '0.2'})
+        elif roll < self.throttle_rate + self.error_rate:
+            status, response = 500, web.Response(status=500, text='upstream error')
+        else:
+            query = request.query
+            data = self._bars(query['symbol'], int(query.get('from', 0)), int(query.get('countback', 7)))
+            status, response = 200, web.json_response(data)
+
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        return response
+
+    async def start(self, port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get('/tvnew/history', self.handle_history)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}/tvnew/history'
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class FakeBot:
+    """Records send_message calls instead of talking to Telegram"""
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sent += 1
+
+
+def seed_alerts(db, fake: FakeVietstock, alerts: int, symbols: int, fire_rate: float, seed: int = 7):
+    """Insert `alerts` rows spread over users x symbols; fire_rate of them trigger on the first cycle"""
+    rng = random.Random(seed)
+    tickers = [f"S{i:04d}" for i in range(symbols)]
+    users = max(1, alerts // symbols)
+
+    def rows():
+        for n in range(alerts):
+            symbol = tickers[n % symbols]
+            chat_id = 100000 + n // symbols
+            price = fake.base_price(symbol)
+            if rng.random() < fire_rate:
+                target = round(price * rng.uniform(0.80, 0.99), 2)
+            else:
+                target = round(price * rng.uniform(1.05, 1.30), 2)
+            yield chat_id, symbol, target
+
+    # Streamed so the seed data doesn't inflate the measured peak RSS
+    db.conn.executemany('INSERT INTO alerts (chat_id, symbol, target_price) VALUES (?, ?, ?)', rows())
+    db.conn.commit()
+    return users
+
+
+async def run_size(args) -> Dict:
+    fake = FakeVietstock(args.latency, args.error_rate, args.throttle_rate)
+    url = await fake.start()
+
+    import config
+    config.VIETSTOCK_API_URL = url
+
+    from database import Database
+    db = Database()
+    users = seed_alerts(db, fake, args.run, args.symbols, args.fire_rate)
+
+    started = time.perf_counter()
+    db.load_index()
+    index_build = time.perf_counter() - started
+
+    import bot
+    bot.is_trading_hours = lambda: True
+    fake_bot = FakeBot(args.telegram_latency)
+    bot.bot_app = type('FakeApp', (), {'bot': fake_bot})()
+    bot.dispatcher.start(fake_bot)
+    bot.outbox.start()
+
+    # Time every upstream request and every DB worker batch
+    fetch_latencies: List[float] = []
+    engine_get_json = bot.price_checker.engine.get_json
+
+    async def timed_get_json(*a, **kw):
+        t0 = time.perf_counter()
+        try:
+            return await engine_get_json(*a, **kw)
+        finally:
+            fetch_latencies.append(time.perf_counter() - t0)
+
+    bot.price_checker.engine.get_json = timed_get_json
+
+    db_time = [0.0]
+    execute = bot.db._execute
+
+    def timed_execute(batch):
+        t0 = time.perf_counter()
+        try:
+            execute(batch)
+        finally:
+            db_time[0] += time.perf_counter() - t0
+
+    bot.db._execute = timed_execute
+
+    cycles = []
+    for _ in range(args.cycles):
+        fetch_latencies.clear()
+        db_time[0] = 0.0
+        sent_before = fake_bot.sent
+        coalesced_before = bot.dispatcher.coalesced
+
+        t0 = time.perf_counter()
+        await bot.check_alerts()
+        cycle = time.perf_counter() - t0
+        await bot.dispatcher.join()
+        drained = time.perf_counter() - t0
+
+        notifications = fake_bot.sent - sent_before
+        triggers = notifications + bot.dispatcher.coalesced - coalesced_before
+        cycles.append({
+            'cycle_s': cycle,
+            'requests': len(fetch_latencies),
+            'fetch_p50_ms': percentile(fetch_latencies, 50) * 1000,
+            'fetch_p99_ms': percentile(fetch_latencies, 99) * 1000,
+            'db_s': db_time[0],
+            'triggers': triggers,
+            'notifications': notifications,
+            'notifications_per_s': notifications / drained if notifications else 0.0,
+        })
+
+    await bot.dispatcher.stop()
+    await bot.outbox.stop()
+    await bot.price_checker.close_session()
+    await fake.stop()
+
+    return {
+        'alerts': args.run,
+        'symbols': args.symbols,
+        'users': users,
+        'index_build_s': index_build,
+        'upstream_requests': fake.requests,
+        'upstream_status': fake.status_counts,
+        'cycles': cycles,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def run_in_subprocess(size: int, args) -> Dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.setdefault('BOT_TOKEN', 'benchmark')
+        env['BENCH_DATABASE_FILE'] = os.path.join(tmp, 'alerts.db')
+        if not args.real_limits:
+            # Measure our own overhead, not Telegram's rate limits
+            env['NOTIFY_GLOBAL_RATE'] = '100000'
+            env['NOTIFY_CHAT_RATE'] = '100000'
+
+        cmd = [sys.executable, os.path.abspath(__file__), '--run', str(size),
+               '--symbols', str(min(args.symbols, size)), '--latency', str(args.latency),
+               '--error-rate', str(args.error_rate), '--throttle-rate', str(args.throttle_rate),
+               '--fire-rate', str(args.fire_rate), '--cycles', str(args.cycles),
+               '--telegram-latency', str(args.telegram_latency)]
+        if args.adaptive:
+            cmd.append('--adaptive')
+        output = subprocess.run(cmd, env=env, capture_output=True, text=True, cwd=tmp)
+        if output.returncode != 0:
+            print(output.stdout[-2000:], output.stderr[-4000:])
+            raise SystemExit(f"❌ Benchmark run for {size} alerts failed")
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def print_report(results: List[Dict]):
+    print(f"\n{'alerts':>8} {'symbols':>7} {'fetched':>7} {'cycle s':>8} {'fetch p50':>10} {'fetch p99':>10} "
+          f"{'db s':>7} {'fired':>6} {'notif':>6} {'notif/s':>8} {'index s':>8} {'RSS MB':>7}")
+    for result in results:
+        for n, cycle in enumerate(result['cycles']):
+            print(f"{result['alerts']:>8} {result['symbols']:>7} {cycle.get('requests', 0):>7} {cycle['cycle_s']:>8.3f} "
+                  f"{cycle['fetch_p50_ms']:>8.1f}ms {cycle['fetch_p99_ms']:>8.1f}ms "
+                  f"{cycle['db_s']:>7.3f} {cycle.get('triggers', cycle['notifications']):>6} {cycle['notifications']:>6} {cycle['notifications_per_s']:>8.0f} "
+                  f"{result['index_build_s'] if n == 0 else 0:>8.3f} "
+                  f"{result['peak_rss_mb'] if n == 0 else 0:>7.1f}")
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path) as f:
+        baseline = {r['alerts']: r for r in json.load(f)}
+
+    ok = True
+    for result in results:
+        base = baseline.get(result['alerts'])
+        if not base:
+            continue
+        now = min(c['cycle_s'] for c in result['cycles'])
+        before = min(c['cycle_s'] for c in base['cycles'])
+        change = (now - before) / before if before else 0
+        status = '✅' if change <= tolerance else '❌'
+        ok = ok and change <= tolerance
+        print(f"{status} {result['alerts']} alerts: best cycle {before:.3f}s → {now:.3f}s ({change:+.0%})")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the alert check cycle")
+    parser.add_argument('--alerts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--symbols', type=int, default=400, help="distinct tickers across all alerts")
+    parser.add_argument('--latency', type=float, default=20, help="mean upstream latency (ms)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument('--fire-rate', type=float, default=0.02, help="fraction of alerts that trigger")
+    parser.add_argument('--cycles', type=int, default=2)
+    parser.add_argument('--telegram-latency', type=float, default=0, help="fake send_message latency (ms)")
+    parser.add_argument('--real-limits', action='store_true', help="keep Telegram rate limits")
+    parser.add_argument('--adaptive', action='store_true', help="skip symbols not due (adaptive polling)")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="compare against a previous --json file")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed cycle time regression")
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Child process: configure before the bot modules are imported
+        import config
+        config.DATABASE_FILE = os.environ['BENCH_DATABASE_FILE']
+        if not args.adaptive:
+            # Fetch every symbol every cycle, so cycles are comparable
+            config.POLL_MAX_INTERVAL = 0
+        print(json.dumps(asyncio.run(run_size(args))))
+        return
+
+    results = []
+    for size in args.alerts:
+        print(f"⏱️  Benchmarking {size:,} alerts...")
+        results.append(run_in_subprocess(size, args))
+
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to {args.json}")
+
+    if args.baseline and not compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,32 @@
+import asyncio
 import logging
 import os
+import signal
 import threading
-from datetime import datetime, timedelta, timezone
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes
 
 import config
-from database import Database
+import metrics
+from alert_index import ABOVE, BELOW
+from bars import Quote
+from database import AsyncDatabase
+from notifier import NotificationDispatcher, ReplyRateLimiter, text_length
+from outbox import OutboxDrainer
+from pipeline import AlertPipeline
+from poll_scheduler import PollScheduler
 from price_checker import PriceChecker
+from sharding import ShardCoordinator, TelegramLease
+from trading_calendar import TradingCalendar, VN_TZ, parse_holidays
+from update_processor import PerChatUpdateProcessor
 
 
 class HealthCheckHandler(BaseHTTPRequestHandler):
@@ -20,6 +36,13 @@ class HealthCheckHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'text/plain')
             self.end_headers()
             self.wfile.write(b'OK')
+        elif self.path == '/metrics':
+            body = metrics.REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
         else:
             self.send_response(404)
             self.end_headers()
@@ -51,41 +74,133 @@ logging.getLogger('telegram.ext._application').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # Initialize components
-db = Database()
+db = AsyncDatabase()
 price_checker = PriceChecker()
 scheduler = AsyncIOScheduler()
+trading_calendar = TradingCalendar(parse_holidays(config.TRADING_HOLIDAYS))
+poll_scheduler = PollScheduler(
+    min_interval=config.CHECK_INTERVAL,
+    max_interval=config.POLL_MAX_INTERVAL,
+    limit_band=config.PRICE_LIMIT_BAND,
+)
+dispatcher = NotificationDispatcher(
+    workers=config.NOTIFY_WORKERS,
+    global_rate=config.NOTIFY_GLOBAL_RATE,
+    chat_rate=config.NOTIFY_CHAT_RATE,
+    coalesce_window=config.NOTIFY_COALESCE_WINDOW,
+)
+
+# Header and footer around one or more triggered alerts sent to a chat together
+TRIGGER_MESSAGE = ("🎯 *CẢNH BÁO GIÁ!*\n\n", "\n_Cảnh báo đã được tự động xóa_")
+
+outbox = OutboxDrainer(
+    db,
+    dispatcher,
+    group=TRIGGER_MESSAGE,
+    interval=config.OUTBOX_FLUSH_INTERVAL,
+    retry_interval=config.OUTBOX_RETRY_INTERVAL,
+    max_attempts=config.OUTBOX_MAX_ATTEMPTS,
+    scan_fresh=config.WORKER_MODE == 'bot',  # Pollers in other processes fill the outbox too
+)
+
+# Sharded polling: this process's place in the worker ring, and the lease that
+# keeps Telegram polling to a single process
+coordinator = None
+telegram_lease = None
+if config.WORKER_MODE != 'all':
+    coordinator = ShardCoordinator(
+        db,
+        config.WORKER_ID,
+        heartbeat=config.SHARD_HEARTBEAT,
+        sync_interval=config.SHARD_SYNC_INTERVAL,
+        change_retention=config.SHARD_CHANGE_RETENTION,
+    )
+    telegram_lease = TelegramLease(
+        db, config.WORKER_ID, heartbeat=config.SHARD_HEARTBEAT, on_lost=lambda: bot_app.stop_running()
+    )
+
+# Scrape-time gauges over live components
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_alerts_indexed', 'Alerts held in the in-memory trigger index', lambda: len(db.index)))
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_notification_queue_depth', 'Notifications waiting to be sent', dispatcher.qsize))
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_outbox_inflight', 'Outbox notifications handed to the dispatcher, not yet resolved', outbox.pending))
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_shard_workers', 'Live polling workers in the shard ring (1 when not sharded)',
+    lambda: len(coordinator.members()) if coordinator is not None else 1))
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_pipeline_queue_depth', 'Items waiting in front of each polling pipeline stage',
+    lambda: pipeline.depths(), labelnames=('stage',)))
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_price_cache_lookups_total', 'Price cache lookups by result',
+    lambda: {(result,): price_checker.cache_stats()[result] for result in ('hits', 'misses', 'coalesced')},
+    labelnames=('result',), kind='counter'))
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_price_cache_hit_ratio', 'Share of price lookups served without a new upstream call',
+    lambda: price_checker.cache_stats()['hit_rate']))
+metrics.REGISTRY.register(metrics.Gauge(
+    'stockbot_symbols_known', 'Tickers in the symbol directory', lambda: len(price_checker.symbols)))
 
 # Store bot application globally for scheduler access
 bot_app = None
 
+# Rendered /list pages per chat: chat_id -> (expires_at, pages), so page turns don't re-fetch prices
+# Every handler that writes alerts drops the chat's snapshot
+list_snapshots: Dict[int, Tuple[float, List[str]]] = {}
+
 
 def get_vn_time():
     """Get current Vietnam time (UTC+7)"""
-    return datetime.now(timezone.utc) + timedelta(hours=7)
+    return datetime.now(VN_TZ)
 
 
 def is_trading_hours() -> bool:
-    """Check if current time is within trading hours (9:00-11:30, 13:00-15:00 VN time)"""
-    vn_time = get_vn_time()
-    current_time = vn_time.time()
+    """Check if an exchange session is in progress (ATO, continuous, ATC, put-through)"""
+    return trading_calendar.is_open()
+
 
-    # Check if weekend
-    if vn_time.weekday() >= 5:
-        return False
+async def open_price_checks():
+    """Trading window opened - start the polling pipeline"""
+    pipeline.start()
 
-    # Morning session: 9:00 - 11:30
-    morning_start = datetime.strptime("09:00", "%H:%M").time()
-    morning_end = datetime.strptime("11:30", "%H:%M").time()
 
-    # Afternoon session: 13:00 - 15:00
-    afternoon_start = datetime.strptime("13:00", "%H:%M").time()
-    afternoon_end = datetime.strptime("15:00", "%H:%M").time()
+async def close_price_checks():
+    """Trading window closed - stop polling once in-flight quotes are handled, then re-arm"""
+    await pipeline.stop()
+    arm_price_checks()
 
-    # Check if in trading hours
-    in_morning = morning_start <= current_time <= morning_end
-    in_afternoon = afternoon_start <= current_time <= afternoon_end
 
-    return in_morning or in_afternoon
+def arm_price_checks():
+    """Schedule the pipeline for the current or next trading window, then re-arm when it closes"""
+    now = get_vn_time()
+    window = trading_calendar.next_window(now)
+    if window is None:
+        logger.warning("No trading session found in the calendar, price checks are paused")
+        return
+
+    start, end = window
+    # Late runs must still happen, or polling never starts / never resumes
+    scheduler.add_job(
+        open_price_checks,
+        'date',
+        run_date=max(start, now),
+        id='open_price_checks',
+        replace_existing=True,
+        misfire_grace_time=None
+    )
+    scheduler.add_job(
+        close_price_checks,
+        'date',
+        run_date=end,
+        id='arm_price_checks',
+        replace_existing=True,
+        misfire_grace_time=None
+    )
+    if start > now:
+        logger.info(f"💤 Market closed - next price check at {start:%Y-%m-%d %H:%M} (VN)")
+    else:
+        logger.info(f"📈 Trading session open until {end:%H:%M} (VN)")
 
 
 def format_price(price: float) -> str:
@@ -96,6 +211,55 @@ def format_price(price: float) -> str:
         return f"{price:,.1f}"
 
 
+def parse_condition(text: str) -> Tuple[str, float, bool]:
+    """Parse an alert condition into (direction, value, is_percent).
+
+    `25` / `>25` - price rises to 25, `<25` - price falls to 25,
+    `+5%` / `-5%` - price moves 5% from the current price.
+    Raises ValueError on malformed input.
+    """
+    if text.endswith('%'):
+        percent = float(text[:-1])
+        return (ABOVE if percent > 0 else BELOW), percent, True
+
+    direction = ABOVE
+    for prefix, side in (('>=', ABOVE), ('<=', BELOW), ('>', ABOVE), ('<', BELOW)):
+        if text.startswith(prefix):
+            direction, text = side, text[len(prefix):]
+            break
+    return direction, float(text), False
+
+
+def condition_error(value: float, is_percent: bool) -> Optional[str]:
+    """Why a parsed condition can't be used, if it can't"""
+    if is_percent:
+        if value == 0 or value <= -100:
+            return "% phải khác 0 và lớn hơn -100"
+    elif value <= 0:
+        return "giá phải > 0"
+    return None
+
+
+def resolve_target(value: float, is_percent: bool, current_price: float) -> Tuple[float, Optional[float]]:
+    """Return (target_price, base_price); percent alerts move from the current price"""
+    if not is_percent:
+        return value, None
+    return round(current_price * (1 + value / 100), 2), current_price
+
+
+def describe_condition(target_price: float, direction: str, base_price: Optional[float] = None) -> str:
+    """Human readable condition, e.g. '≤ 24,000' or '≥ 26.2 (+5.0% từ 25)'"""
+    text = f"{'≥' if direction == ABOVE else '≤'} {format_price(target_price)}"
+    if base_price:
+        text += f" ({(target_price / base_price - 1) * 100:+.1f}% từ {format_price(base_price)})"
+    return text
+
+
+def remaining_distance(target_price: float, direction: str, current_price: float) -> float:
+    """How far the price still has to move toward the target (<= 0 means reached)"""
+    return target_price - current_price if direction == ABOVE else current_price - target_price
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send welcome message"""
     welcome_msg = """
@@ -105,6 +269,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 *Các lệnh có sẵn:*
 /alert <MÃ> <GIÁ> - Đặt cảnh báo (VD: /alert HPG 25500)
+/alert <MÃ> <GIÁ - Báo khi giá giảm xuống (VD: /alert HPG <24000)
+/alert <MÃ> +N% - Báo khi giá tăng/giảm N% (VD: /alert HPG +5%)
 /list - Xem danh sách cảnh báo
 /edit <MÃ> <GIÁ> - Sửa giá alert (VD: /edit HPG 26500)
 /remove <MÃ> - Xóa alert theo mã
@@ -127,7 +293,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     help_msg = """
 📋 *Danh sách lệnh:*
 
-/alert <MÃ> <GIÁ> - Đặt cảnh báo
+/alert <MÃ> <GIÁ> - Đặt cảnh báo (giá tăng lên)
+/alert <MÃ> <GIÁ - Cảnh báo giá giảm xuống
+/alert <MÃ> ±N% - Cảnh báo theo % thay đổi
 /list - Xem danh sách alerts
 /edit <MÃ> <GIÁ> - Sửa giá alert
 /remove <MÃ> - Xóa alert
@@ -137,6 +305,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 *Ví dụ:*
 `/alert HPG 26500`
+`/alert HPG <24000`
+`/alert HPG -5%`
 `/price HPG`
 `/edit HPG 27000`
     """
@@ -149,8 +319,12 @@ async def guide_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📖 *Hướng dẫn chi tiết:*
 
 *1️⃣ Đặt cảnh báo:*
-`/alert HPG 25500`
+`/alert HPG 25500` hoặc `/alert HPG >25500`
 → Nhận thông báo khi HPG đạt ≥ 25,500 VNĐ
+`/alert HPG <24000`
+→ Nhận thông báo khi HPG giảm xuống ≤ 24,000 VNĐ (cắt lỗ)
+`/alert HPG +5%` / `/alert HPG -5%`
+→ Nhận thông báo khi HPG tăng/giảm 5% so với giá lúc đặt
 
 *2️⃣ Xem danh sách:*
 `/list`
@@ -159,6 +333,7 @@ async def guide_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 *3️⃣ Sửa giá alert:*
 `/edit HPG 26500`
 → Sửa alert HPG thành giá mới 26,500 VNĐ
+(dùng được cả `<GIÁ` và `±N%` như khi đặt)
 
 *4️⃣ Xóa alert:*
 `/remove HPG` - Xóa alert của mã HPG
@@ -176,7 +351,7 @@ async def guide_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 *Ví dụ thực tế:*
 • `/alert VNM 80000` - Báo khi VNM ≥ 80,000 VNĐ
 • `/list` - Xem alerts
-• `/edit VNM 81000` - Sửa thành 81,000 VNĐ
+• `/edit VNM 81000` - Sửa thành 81,000 VNĐ (giữ chiều ≥ / ≤ cũ)
 • `/remove VNM` - Xóa alert VNM
 • `/clear` - Xóa hết
     """
@@ -199,7 +374,9 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "`/alert HPG 25500`\n\n"
             "*Cách 2 (nhiều):*\n"
             "`/alert HPG 25500 VNM 80000 FPT 120000`\n\n"
-            "Format: `<MÃ> <GIÁ>` (cặp mã-giá, cách nhau bằng space)",
+            "Format: `<MÃ> <GIÁ>` (cặp mã-giá, cách nhau bằng space)\n"
+            "Giá giảm xuống: `<GIÁ` (VD: `HPG <24000`)\n"
+            "Theo %: `+N%` / `-N%` (VD: `HPG +5%`)",
             parse_mode='Markdown'
         )
         return
@@ -216,29 +393,30 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Parse all symbol-price pairs
+    # Parse all symbol-condition pairs
     alerts_to_add = []
     invalid_prices = []
 
     for i in range(0, len(context.args), 2):
         symbol = context.args[i].upper()
         try:
-            target_price = float(context.args[i + 1])
-
-            if target_price <= 0:
-                invalid_prices.append(f"{symbol} {context.args[i + 1]} (giá phải > 0)")
-                continue
-
-            alerts_to_add.append((symbol, target_price))
-
+            direction, value, is_percent = parse_condition(context.args[i + 1])
         except ValueError:
             invalid_prices.append(f"{symbol} {context.args[i + 1]} (giá không hợp lệ)")
+            continue
+
+        error = condition_error(value, is_percent)
+        if error:
+            invalid_prices.append(f"{symbol} {context.args[i + 1]} ({error})")
+            continue
+
+        alerts_to_add.append((symbol, direction, value, is_percent))
 
     if invalid_prices:
         await update.message.reply_text(
             f"⚠️ *Giá không hợp lệ:*\n"
             f"{chr(10).join('• ' + item for item in invalid_prices)}\n\n"
-            f"Giá phải là số > 0",
+            f"Giá phải là số > 0, có thể kèm `<` / `>`, hoặc `+N%` / `-N%`",
             parse_mode='Markdown'
         )
         return
@@ -249,7 +427,7 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Single alert - quick path (no progress message)
     if len(alerts_to_add) == 1:
-        symbol, target_price = alerts_to_add[0]
+        symbol, direction, value, is_percent = alerts_to_add[0]
 
         # Validate symbol
         await update.message.reply_text(f"⏳ Đang kiểm tra mã {symbol}...")
@@ -264,9 +442,13 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         # Get current price
         current_price = await price_checker.get_price(symbol)
+        if is_percent and not current_price:
+            await update.message.reply_text(f"❌ Không lấy được giá hiện tại của {symbol} để tính %!")
+            return
+        target_price, base_price = resolve_target(value, is_percent, current_price)
 
         # Check if alert already exists
-        if db.alert_exists(chat_id, symbol):
+        if await db.alert_exists(chat_id, symbol):
             await update.message.reply_text(
                 f"⚠️ *Cảnh báo đã tồn tại!*\n\n"
                 f"Bạn đã có alert cho *{symbol}*\n\n"
@@ -275,14 +457,22 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
+        list_snapshots.pop(chat_id, None)
         # Add alert to database
-        if db.add_alert(chat_id, symbol, target_price):
+        if await db.add_alert(chat_id, symbol, target_price, direction, base_price):
             msg = (
                 f"✅ *Đã đặt cảnh báo!*\n\n"
                 f"📊 Mã: *{symbol}*\n"
                 f"🎯 Giá mục tiêu: *{format_price(target_price)}* VNĐ\n"
-                f"💰 Giá hiện tại: *{format_price(current_price)}* VNĐ\n\n"
-                f"Bot sẽ thông báo khi {symbol} đạt ≥ {format_price(target_price)}"
+            )
+
+            # The symbol may be known to the directory while its price fetch failed
+            if current_price:
+                msg += f"💰 Giá hiện tại: *{format_price(current_price)}* VNĐ\n"
+
+            msg += (
+                f"\nBot sẽ thông báo khi {symbol} {'đạt' if direction == ABOVE else 'giảm xuống'} "
+                f"{describe_condition(target_price, direction, base_price)}"
             )
             await update.message.reply_text(msg, parse_mode='Markdown')
         else:
@@ -296,34 +486,47 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     # Validate all symbols first (batch)
-    symbols_to_validate = [symbol for symbol, _ in alerts_to_add]
+    symbols_to_validate = [symbol for symbol, _, _, _ in alerts_to_add]
     await progress_msg.edit_text(
         f"⏳ Đang kiểm tra {len(symbols_to_validate)} mã cổ phiếu..."
     )
 
-    # Fetch prices for all symbols in parallel
-    prices = await price_checker.get_multiple_prices(symbols_to_validate)
+    # Fetch prices for all symbols in parallel, skipping tickers the directory knows are bad
+    prices = await price_checker.get_multiple_prices(
+        [symbol for symbol in symbols_to_validate if price_checker.symbols.lookup(symbol) is not False]
+    )
 
     # Process results
     added = []
     skipped = []
     invalid = []
 
-    for symbol, target_price in alerts_to_add:
+    # Insert every valid pair in ONE transaction (one commit, not one per symbol)
+    targets = {}
+    valid_alerts = []
+    for symbol, direction, value, is_percent in alerts_to_add:
+        if symbol in prices and symbol not in targets:
+            target_price, base_price = targets[symbol] = resolve_target(value, is_percent, prices[symbol])
+            valid_alerts.append((symbol, target_price, direction, base_price))
+    list_snapshots.pop(chat_id, None)
+    outcomes = await db.add_alerts(chat_id, valid_alerts) if valid_alerts else {}
+    reported = set()
+
+    for symbol, direction, _, _ in alerts_to_add:
         # Check if symbol is valid
         if symbol not in prices:
             invalid.append(f"{symbol} (không tìm thấy)")
             continue
 
-        # Check if alert already exists
-        if db.alert_exists(chat_id, symbol):
+        # Check if alert already exists (also covers a symbol repeated in the command)
+        if symbol in reported or outcomes.get(symbol) is False:
             skipped.append(f"{symbol} (đã tồn tại)")
             continue
+        reported.add(symbol)
 
-        # Add alert
-        if db.add_alert(chat_id, symbol, target_price):
+        if outcomes.get(symbol):
             current_price = prices[symbol]
-            added.append((symbol, target_price, current_price))
+            added.append((symbol, targets[symbol], direction, current_price))
         else:
             skipped.append(f"{symbol} (lỗi database)")
 
@@ -332,9 +535,9 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if added:
         result_msg += f"✅ *Đã thêm {len(added)} alerts:*\n"
-        for symbol, target, current in added:
-            distance = target - current
-            result_msg += f"• {symbol}: {format_price(target)} VNĐ "
+        for symbol, (target, base), direction, current in added:
+            distance = remaining_distance(target, direction, current)
+            result_msg += f"• {symbol}: {describe_condition(target, direction, base)} VNĐ "
             result_msg += f"(hiện tại: {format_price(current)}, "
             if distance > 0:
                 result_msg += f"còn {format_price(distance)})\n"
@@ -359,52 +562,133 @@ async def alert_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await progress_msg.edit_text(result_msg, parse_mode='Markdown')
 
 
+def paginate(chunks: List[str], header: str, footer: str, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> List[str]:
+    """Pack whole chunks into pages that fit one Telegram message each"""
+    budget = limit - text_length(header) - text_length(footer) - 32  # room for the page marker
+    pages, page, size = [], '', 0
+    for chunk in chunks:
+        chunk_size = text_length(chunk)
+        if page and size + chunk_size > budget:
+            pages.append(page)
+            page, size = '', 0
+        page += chunk
+        size += chunk_size
+    pages.append(page)
+
+    total = len(pages)
+    return [
+        header + (f"_Trang {n}/{total}_\n\n" if total > 1 else '') + page + footer
+        for n, page in enumerate(pages, 1)
+    ]
+
+
+def list_keyboard(page: int, total: int) -> Optional[InlineKeyboardMarkup]:
+    """Prev/next buttons for a /list page"""
+    if total <= 1:
+        return None
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ Trước", callback_data=f"list:{page - 1}"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("Sau ▶️", callback_data=f"list:{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+
+async def build_list_pages(chat_id: int) -> List[str]:
+    """Render a user's alerts with current prices, fetched in one batch, into pages"""
+    alerts = await db.get_user_alerts(chat_id)
+    if not alerts:
+        list_snapshots.pop(chat_id, None)
+        return []
+
+    # One concurrent fetch for every distinct symbol instead of one round trip per alert
+    prices = await price_checker.get_multiple_prices(list(dict.fromkeys(alert[1] for alert in alerts)))
+
+    chunks = []
+    for alert_id, symbol, target_price, direction, base_price in alerts:
+        current_price = prices.get(symbol)
+        chunk = f"*ID {alert_id}:* {symbol}\n"
+        chunk += f"  🎯 Target: {describe_condition(target_price, direction, base_price)}\n"
+
+        # Calculate distance to target
+        if current_price:
+            distance = remaining_distance(target_price, direction, current_price)
+            distance_pct = (distance / current_price * 100) if current_price else 0
+
+            if distance > 0:
+                arrow = "📈" if direction == ABOVE else "📉"
+                status = f"{arrow} Còn {format_price(distance)} ({distance_pct:.1f}%)"
+            else:
+                status = f"✅ Đã đạt!"
+
+            chunk += f"  💰 Hiện tại: {format_price(current_price)}\n"
+            chunk += f"  {status}\n\n"
+        else:
+            chunk += f"  💰 Hiện tại: N/A\n\n"
+        chunks.append(chunk)
+
+    footer = (
+        f"_Tổng: {len(alerts)} cảnh báo_\n\n"
+        "💡 *Thao tác:*\n"
+        "`/edit <MÃ> <GIÁ>` - Sửa\n"
+        "`/remove <MÃ>` - Xóa alert\n"
+        "`/clear` - Xóa tất cả"
+    )
+    pages = paginate(chunks, "📋 *Danh sách cảnh báo:*\n\n", footer)
+
+    now = time.monotonic()
+    if len(list_snapshots) > 1000:
+        for expired in [chat for chat, (expires_at, _) in list_snapshots.items() if expires_at < now]:
+            del list_snapshots[expired]
+    list_snapshots[chat_id] = (now + config.LIST_SNAPSHOT_TTL, pages)
+    return pages
+
+
 async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List all alerts for user"""
     if not update.message:
         return
 
     chat_id = update.effective_chat.id
-    alerts = db.get_user_alerts(chat_id)
+    pages = await build_list_pages(chat_id)
 
-    if not alerts:
+    if not pages:
         await update.message.reply_text(
             "📭 Bạn chưa có cảnh báo nào!\n\n"
             "Đặt cảnh báo bằng: /alert HPG 25500"
         )
         return
 
-    msg = "📋 *Danh sách cảnh báo:*\n\n"
+    await update.message.reply_text(pages[0], parse_mode='Markdown', reply_markup=list_keyboard(0, len(pages)))
 
-    for alert_id, symbol, target_price in alerts:
-        current_price = await price_checker.get_price(symbol)
 
-        # Calculate distance to target
-        if current_price:
-            distance = target_price - current_price
-            distance_pct = (distance / current_price * 100) if current_price else 0
+async def list_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Turn a /list page, reusing the snapshot while it is fresh"""
+    query = update.callback_query
+    chat_id = query.message.chat.id
+    page = int(context.matches[0].group(1))
 
-            if distance > 0:
-                status = f"📈 Còn {format_price(distance)} ({distance_pct:.1f}%)"
-            else:
-                status = f"✅ Đã đạt!"
-
-            msg += f"*ID {alert_id}:* {symbol}\n"
-            msg += f"  🎯 Target: {format_price(target_price)}\n"
-            msg += f"  💰 Hiện tại: {format_price(current_price)}\n"
-            msg += f"  {status}\n\n"
-        else:
-            msg += f"*ID {alert_id}:* {symbol}\n"
-            msg += f"  🎯 Target: {format_price(target_price)}\n"
-            msg += f"  💰 Hiện tại: N/A\n\n"
+    snapshot = list_snapshots.get(chat_id)
+    if snapshot is not None and snapshot[0] >= time.monotonic():
+        pages = snapshot[1]
+    else:
+        pages = await build_list_pages(chat_id)
+    await query.answer()
 
-    msg += f"_Tổng: {len(alerts)} cảnh báo_\n\n"
-    msg += "💡 *Thao tác:*\n"
-    msg += "`/edit <MÃ> <GIÁ>` - Sửa\n"
-    msg += "`/remove <MÃ>` - Xóa alert\n"
-    msg += "`/clear` - Xóa tất cả"
+    if not pages:
+        await query.edit_message_text("📭 Bạn chưa có cảnh báo nào!")
+        return
 
-    await update.message.reply_text(msg, parse_mode='Markdown')
+    page = min(page, len(pages) - 1)
+    try:
+        await query.edit_message_text(
+            pages[page], parse_mode='Markdown', reply_markup=list_keyboard(page, len(pages))
+        )
+    except BadRequest as e:
+        # Double tap on the same button - page is already shown
+        if 'not modified' not in str(e).lower():
+            raise
 
 
 async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -435,7 +719,8 @@ async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Single symbol - quick path
     if len(symbols) == 1:
         symbol = symbols[0]
-        count = db.remove_alerts_by_symbol(chat_id, symbol)
+        list_snapshots.pop(chat_id, None)
+        count = await db.remove_alerts_by_symbol(chat_id, symbol)
 
         if count > 0:
             await update.message.reply_text(
@@ -453,8 +738,12 @@ async def remove_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     removed = []
     not_found = []
 
+    list_snapshots.pop(chat_id, None)
+    # Remove every symbol in ONE transaction
+    counts = await db.remove_alerts(chat_id, symbols)
+
     for symbol in symbols:
-        count = db.remove_alerts_by_symbol(chat_id, symbol)
+        count = counts.get(symbol, 0)
         if count > 0:
             removed.append((symbol, count))
         else:
@@ -499,43 +788,55 @@ async def edit_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     symbol = context.args[0].upper()
 
     try:
-        new_price = float(context.args[1])
+        direction, value, is_percent = parse_condition(context.args[1])
     except ValueError:
         await update.message.reply_text(
             "❌ Giá không hợp lệ!\n"
-            "Giá phải là số"
+            "Giá phải là số, có thể kèm < / >, hoặc +N% / -N%"
         )
         return
 
-    if new_price <= 0:
-        await update.message.reply_text("❌ Giá phải lớn hơn 0!")
+    error = condition_error(value, is_percent)
+    if error:
+        await update.message.reply_text(f"❌ Không hợp lệ: {error}!")
         return
 
     # Check if user has alert for this symbol
-    if not db.alert_exists(chat_id, symbol):
+    if not await db.alert_exists(chat_id, symbol):
         await update.message.reply_text(
             f"❌ Bạn chưa có alert cho mã *{symbol}*\n\n"
-            f"Dùng /alert {symbol} {int(new_price)} để tạo mới",
+            f"Dùng /alert {symbol} {context.args[1]} để tạo mới",
             parse_mode='Markdown'
         )
         return
 
-    # Update alert
-    if db.update_alert_by_symbol(chat_id, symbol, new_price):
-        current_price = await price_checker.get_price(symbol)
+    # A bare price only moves the target: a stop-loss edited to `24000` stays a stop-loss
+    if not is_percent and not context.args[1].startswith(('<', '>')):
+        existing = db.index.get(chat_id, symbol)
+        if existing is not None:
+            direction = existing[2]
+
+    current_price = await price_checker.get_price(symbol)
+    if is_percent and not current_price:
+        await update.message.reply_text(f"❌ Không lấy được giá hiện tại của {symbol} để tính %!")
+        return
+    new_price, base_price = resolve_target(value, is_percent, current_price)
 
+    list_snapshots.pop(chat_id, None)
+    # Update alert
+    if await db.update_alert_by_symbol(chat_id, symbol, new_price, direction, base_price):
         msg = (
             f"✅ *Đã cập nhật alert!*\n\n"
             f"📊 Mã: *{symbol}*\n"
-            f"🎯 Giá mới: *{format_price(new_price)}* VNĐ\n"
+            f"🎯 Giá mới: *{describe_condition(new_price, direction, base_price)}* VNĐ\n"
         )
 
         if current_price:
             msg += f"💰 Giá hiện tại: *{format_price(current_price)}* VNĐ\n"
 
-            await update.message.reply_text(msg, parse_mode='Markdown')
-        else:
-            await update.message.reply_text("❌ Lỗi khi cập nhật alert!")
+        await update.message.reply_text(msg, parse_mode='Markdown')
+    else:
+        await update.message.reply_text("❌ Lỗi khi cập nhật alert!")
 
 
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -544,7 +845,8 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     chat_id = update.effective_chat.id
-    count = db.clear_user_alerts(chat_id)
+    list_snapshots.pop(chat_id, None)
+    count = await db.clear_user_alerts(chat_id)
 
     if count > 0:
         await update.message.reply_text(
@@ -570,6 +872,13 @@ async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     symbol = context.args[0].upper()
+    if price_checker.symbols.lookup(symbol) is False:
+        await update.message.reply_text(
+            f"❌ Không tìm thấy thông tin cho mã *{symbol}*",
+            parse_mode='Markdown'
+        )
+        return
+
     await update.message.reply_text(f"⏳ Đang lấy giá {symbol}...")
 
     info = await price_checker.get_stock_info(symbol)
@@ -591,77 +900,56 @@ async def price_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
 
-async def check_alerts():
-    """Background task to check all alerts"""
+async def refresh_symbols():
+    """Reload the exchange listing, if configured, and save symbols learned from fetches"""
+    listing = await price_checker.fetch_symbol_list()
+    if listing:
+        price_checker.symbols.load(listing, authoritative=True)
+        await db.save_symbols(listing, replace=True)
+        logger.info(f"📚 Symbol directory refreshed: {len(listing)} symbols")
 
-    if not is_trading_hours():
-        logger.debug("Outside trading hours, skipping price check")
-        return
+    learned = price_checker.symbols.take_new()
+    if learned:
+        await db.save_symbols(learned)
 
-    alerts = db.get_all_alerts()
 
-    if not alerts:
-        logger.debug("No alerts to check")
-        return
-
-    logger.info(f"⏰ Checking {len(alerts)} alerts...")
-
-    # Step1: Group alerts by symbol to avoid duplicate price fetches
-    # Example: If 5 users have HPG alerts, we only fetch HPG price once
-    alerts_by_symbol = {}
-    for alert_id, chat_id, symbol, target_price in alerts:
-        if symbol not in alerts_by_symbol:
-            alerts_by_symbol[symbol] = []
-        alerts_by_symbol[symbol].append((alert_id, chat_id, target_price))
-
-    # Step 2: Get unique symbols and fetch ALL prices in ONE batch
-    unique_symbols = list(alerts_by_symbol.keys())
-    logger.info(f"📊 Fetching prices for {len(unique_symbols)} unique symbols...")
+def trigger_text(symbol: str, direction: str, target_price: float, quote: Quote) -> str:
+    """Notification body for one fired alert (sent between the TRIGGER_MESSAGE header and footer)"""
+    current_price = quote.price
+    msg = (
+        f"📊 *{symbol}* {'đã đạt' if direction == ABOVE else 'đã giảm xuống'} mục tiêu!\n\n"
+        f"🎯 Giá mục tiêu: *{describe_condition(target_price, direction)}* VNĐ\n"
+        f"💰 Giá hiện tại: *{format_price(current_price)}* VNĐ\n"
+    )
+    if direction == ABOVE and current_price < target_price:
+        msg += f"📈 Đã chạm: *{format_price(quote.high)}* VNĐ\n"
+    elif direction == BELOW and current_price > target_price:
+        msg += f"📉 Đã chạm: *{format_price(quote.low)}* VNĐ\n"
+    return msg
+
+
+# Price polling: fetch, evaluate and deliver stages, started for each trading window
+pipeline = AlertPipeline(
+    db,
+    price_checker,
+    poll_scheduler,
+    outbox if config.WORKER_MODE != 'poller' else None,  # The bot process sends pollers' triggers
+    render=trigger_text,
+    interval=config.CHECK_INTERVAL,
+    queue_size=config.PIPELINE_QUEUE_SIZE,
+    is_open=is_trading_hours,
+    owns=coordinator.owns if coordinator is not None else None,
+)
 
-    # 🔥 THIS IS THE MAGIC - Parallel batch API call
-    prices = await price_checker.get_multiple_prices(unique_symbols)
 
-    # Step 3: Check each alert against fetched prices
-    notifications_sent = 0
-    for symbol, alerts_list in alerts_by_symbol.items():
-        current_price = prices.get(symbol)
+async def check_alerts():
+    """Run one price check cycle through the pipeline and wait until it is fully processed"""
 
-        if current_price is None:
-            logger.warning(f"❌ No price data for {symbol}, skipping alerts")
-            continue
+    if not is_trading_hours():
+        logger.debug("Outside trading hours, skipping price check")
+        return
 
-        # Check all alerts for this symbol
-        for alert_id, chat_id, target_price in alerts_list:
-            try:
-                # Check if price reached target
-                if current_price >= target_price:
-                    # Send notification
-                    msg = (
-                        f"🎯 *CẢNH BÁO GIÁ!*\n\n"
-                        f"📊 *{symbol}* đã đạt mục tiêu!\n\n"
-                        f"🎯 Giá mục tiêu: *{format_price(target_price)}* VNĐ\n"
-                        f"💰 Giá hiện tại: *{format_price(current_price)}* VNĐ\n\n"
-                        f"_Cảnh báo đã được tự động xóa_"
-                    )
-
-                    try:
-                        await bot_app.bot.send_message(
-                            chat_id=chat_id,
-                            text=msg,
-                            parse_mode='Markdown'
-                        )
-                        notifications_sent += 1
-                        logger.info(f"✅ Alert triggered: {symbol} @ {target_price} for chat {chat_id}")
-                    except Exception as e:
-                        logger.error(f"Error sending notification: {e}")
-
-                    # Remove alert after notification
-                    db.remove_alerts_by_symbol(chat_id, symbol)
-
-            except Exception as e:
-                logger.error(f"Error checking alert {alert_id}: {e}")
-
-    logger.info(f"✅ Check complete. {notifications_sent} notifications sent")
+    await pipeline.run_cycle()
 
 
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -675,23 +963,66 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+def add_handlers(application: Application):
+    """Register command handlers"""
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("guide", guide_command))
+    application.add_handler(CommandHandler("alert", alert_command))
+    application.add_handler(CommandHandler("list", list_command))
+    application.add_handler(CallbackQueryHandler(list_page_callback, pattern=r'^list:(\d+)$'))
+    application.add_handler(CommandHandler("remove", remove_command))
+    application.add_handler(CommandHandler("edit", edit_command))
+    application.add_handler(CommandHandler("clear", clear_command))
+    application.add_handler(CommandHandler("price", price_command))
+
+
+async def run_poller():
+    """Poll this worker's share of the symbols; Telegram and notifications stay with the bot process"""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await coordinator.start()
+    arm_price_checks()
+    scheduler.start()
+    logger.info(f"Poller {config.WORKER_ID} started - ring: {', '.join(coordinator.members())}")
+
+    await stopping.wait()
+    logger.info("Stopping poller...")
+    await coordinator.stop()
+    await pipeline.stop()
+    scheduler.shutdown(wait=False)
+    await price_checker.close_session()
+    learned = price_checker.symbols.take_new()
+    if learned:
+        await db.save_symbols(learned)
+    db.close()
+
+
 def main():
     """Start the bot"""
     global bot_app
 
-    # Create application
-    bot_app = Application.builder().token(config.BOT_TOKEN).build()
+    if config.WORKER_MODE == 'poller':
+        start_health_server()
+        asyncio.run(run_poller())
+        return
+
+    # Create application - updates from different chats are handled concurrently,
+    # each chat's updates still one at a time and in order
+    bot_app = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        .concurrent_updates(PerChatUpdateProcessor(config.MAX_CONCURRENT_UPDATES))
+        # Replies share the 30 msg/s budget with trigger notifications
+        .rate_limiter(ReplyRateLimiter(dispatcher))
+        .build()
+    )
 
     # Add command handlers
-    bot_app.add_handler(CommandHandler("start", start))
-    bot_app.add_handler(CommandHandler("help", help_command))
-    bot_app.add_handler(CommandHandler("guide", guide_command))
-    bot_app.add_handler(CommandHandler("alert", alert_command))
-    bot_app.add_handler(CommandHandler("list", list_command))
-    bot_app.add_handler(CommandHandler("remove", remove_command))
-    bot_app.add_handler(CommandHandler("edit", edit_command))
-    bot_app.add_handler(CommandHandler("clear", clear_command))
-    bot_app.add_handler(CommandHandler("price", price_command))
+    add_handlers(bot_app)
 
     # Set bot commands menu (shows when user types /)
     async def post_init(application: Application) -> None:
@@ -707,21 +1038,54 @@ def main():
             ("guide", "Hướng dẫn chi tiết"),
         ])
 
+        # Only one process may poll Telegram; then join the polling ring
+        if telegram_lease is not None:
+            if not await telegram_lease.acquire():
+                raise RuntimeError("Another bot process holds the Telegram lease - run this one as WORKER_MODE=poller")
+            await coordinator.start()
+
+        # Start notification workers before the first check can enqueue,
+        # then resend whatever the outbox still holds from before a restart
+        dispatcher.start(application.bot)
+        outbox.start()
+
+        # Validate tickers from the stored directory; refresh_symbols keeps it current
+        price_checker.symbols.load(await db.get_symbols())
+        logger.info(f"📚 Loaded {len(price_checker.symbols)} known symbols")
+
         # Start scheduler in async context
         if not scheduler.running:
             scheduler.start()  # ← MOVE vào đây!
-            logger.info(f"Scheduler started - checking prices every {config.CHECK_INTERVAL} seconds")
+            logger.info(f"Scheduler started - checking prices every {config.CHECK_INTERVAL} seconds during sessions")
+
+    async def post_shutdown(application: Application) -> None:
+        """Drain queued DB work and release connections"""
+        if coordinator is not None:
+            # Keeps polling until the other workers have taken over our symbols
+            await coordinator.stop()
+            await telegram_lease.release()
+        await pipeline.stop()
+        await dispatcher.stop()
+        await outbox.stop()
+        await price_checker.close_session()
+        learned = price_checker.symbols.take_new()
+        if learned:
+            await db.save_symbols(learned)
+        db.close()
 
     bot_app.post_init = post_init
+    bot_app.post_shutdown = post_shutdown
 
-    # Schedule price checking job (but don't start scheduler yet)
+    # Schedule price checking for trading sessions only (but don't start scheduler yet)
+    arm_price_checks()
     scheduler.add_job(
-        check_alerts,  # ← Function thật
+        refresh_symbols,
         'interval',
-        seconds=config.CHECK_INTERVAL,
-        id='check_alerts'
+        seconds=config.SYMBOL_REFRESH_INTERVAL,
+        next_run_time=get_vn_time(),
+        id='refresh_symbols',
+        replace_existing=True
     )
-    # ← XÓA scheduler.start() ở đây!
 
     logger.info("Bot started successfully!")
 
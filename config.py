@@ -1,4 +1,5 @@
 import os
+import socket
 
 from dotenv import load_dotenv
 
@@ -21,3 +22,72 @@ else:
 
 # Vietstock API
 VIETSTOCK_API_URL = 'https://api.vietstock.vn/tvnew/history'
+
+# Price cache: serves /price, /info and validation for one check cycle by default,
+# bounded for the 256 MB VM. Alert polling always fetches, sharing in-flight requests
+PRICE_CACHE_TTL = float(os.getenv('PRICE_CACHE_TTL', str(CHECK_INTERVAL)))
+PRICE_CACHE_SIZE = int(os.getenv('PRICE_CACHE_SIZE', '2000'))
+
+# Upstream fetch engine: max in-flight requests (adapts down on 429/5xx), retries, timeout
+FETCH_MAX_CONCURRENCY = int(os.getenv('FETCH_MAX_CONCURRENCY', '16'))
+FETCH_MAX_RETRIES = int(os.getenv('FETCH_MAX_RETRIES', '3'))
+FETCH_TIMEOUT = float(os.getenv('FETCH_TIMEOUT', '10'))
+
+# Per-symbol deadline when streaming a batch of prices
+FETCH_SYMBOL_TIMEOUT = float(os.getenv('FETCH_SYMBOL_TIMEOUT', '15'))
+
+# Notification dispatcher: concurrent senders and Telegram rate limits (msg/s)
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', '8'))
+NOTIFY_GLOBAL_RATE = float(os.getenv('NOTIFY_GLOBAL_RATE', '30'))
+NOTIFY_CHAT_RATE = float(os.getenv('NOTIFY_CHAT_RATE', '1'))
+
+# Daily bars kept per symbol; closed bars are never re-downloaded
+BAR_HISTORY_SIZE = int(os.getenv('BAR_HISTORY_SIZE', '30'))
+
+# Exchange holidays (YYYY-MM-DD, comma separated); no price checks on these days or weekends
+TRADING_HOLIDAYS = [d for d in os.getenv('TRADING_HOLIDAYS', '').split(',') if d.strip()]
+
+# Adaptive polling: symbols far from their nearest target are fetched at most every
+# POLL_MAX_INTERVAL seconds; PRICE_LIMIT_BAND is the daily limit (HOSE ±7%)
+POLL_MAX_INTERVAL = float(os.getenv('POLL_MAX_INTERVAL', '300'))
+PRICE_LIMIT_BAND = float(os.getenv('PRICE_LIMIT_BAND', '0.07'))
+
+# How long a rendered /list stays valid for page turns (seconds)
+LIST_SNAPSHOT_TTL = float(os.getenv('LIST_SNAPSHOT_TTL', '60'))
+
+# Triggers for the same chat within this window (seconds) are sent as one message
+NOTIFY_COALESCE_WINDOW = float(os.getenv('NOTIFY_COALESCE_WINDOW', '1'))
+
+# Symbol directory: optional JSON listing of all tickers, how often it is re-downloaded
+# and newly seen symbols saved (seconds), and how long an unknown ticker stays rejected
+SYMBOL_LIST_URL = os.getenv('SYMBOL_LIST_URL', '')
+SYMBOL_REFRESH_INTERVAL = float(os.getenv('SYMBOL_REFRESH_INTERVAL', '21600'))
+SYMBOL_NEGATIVE_TTL = float(os.getenv('SYMBOL_NEGATIVE_TTL', '3600'))
+
+# Trigger outbox: how often delivery results are written back (seconds), how often
+# undelivered rows are retried (seconds), and sends attempted before giving up
+OUTBOX_FLUSH_INTERVAL = float(os.getenv('OUTBOX_FLUSH_INTERVAL', '1'))
+OUTBOX_RETRY_INTERVAL = float(os.getenv('OUTBOX_RETRY_INTERVAL', '30'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+
+# Polling pipeline: max items queued between the fetch, evaluate and deliver stages
+# before the earlier stage waits (backpressure)
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '256'))
+
+# Updates handled at once across all chats (each chat's updates still run in order)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '32'))
+
+# Process role when polling is split across processes sharing DATABASE_FILE:
+#   all    - one process does everything (default)
+#   bot    - Telegram commands and notifications, plus its share of price polling
+#   poller - price polling only, for its share of the symbols
+WORKER_MODE = os.getenv('WORKER_MODE', 'all')
+if WORKER_MODE not in ('all', 'bot', 'poller'):
+    raise ValueError("WORKER_MODE must be one of: all, bot, poller")
+
+# Unique name of this process in the shard ring, lease heartbeat and alert sync
+# intervals (seconds), and how long alert changes are kept for workers to replay
+WORKER_ID = os.getenv('WORKER_ID') or f"{socket.gethostname()}-{os.getpid()}"
+SHARD_HEARTBEAT = float(os.getenv('SHARD_HEARTBEAT', '5'))
+SHARD_SYNC_INTERVAL = float(os.getenv('SHARD_SYNC_INTERVAL', '1'))
+SHARD_CHANGE_RETENTION = float(os.getenv('SHARD_CHANGE_RETENTION', '3600'))
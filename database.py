@@ -1,7 +1,14 @@
+import asyncio
+import concurrent.futures
+import queue
 import sqlite3
-from typing import List, Tuple
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import config
+import metrics
+from alert_index import ABOVE, AlertIndex
 
 
 class Database:
@@ -15,6 +22,7 @@ class Database:
 
     def __init__(self):
         if not hasattr(self, 'conn'):
+            self._batching = False
             self.conn = sqlite3.connect(
                 config.DATABASE_FILE,
                 check_same_thread=False,
@@ -26,6 +34,12 @@ class Database:
             self.conn.execute('PRAGMA synchronous=NORMAL')
             self.create_tables()
 
+            # Resident trigger index, kept in sync by every write below
+            # (and, when sharded, by other processes' writes via the change log)
+            self.index = AlertIndex()
+            self._change_seq = self._last_change()
+            self.load_index()
+
     def create_tables(self):
         """Create alerts table if not exists"""
         cursor = self.conn.cursor()
@@ -35,39 +49,172 @@ class Database:
                 chat_id INTEGER NOT NULL,
                 symbol TEXT NOT NULL,
                 target_price REAL NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                direction TEXT NOT NULL DEFAULT 'above',
+                base_price REAL
             )
         ''')
 
+        # Older DBs only had upward alerts. direction is 'above' (price >= target)
+        # or 'below' (price <= target); base_price is the reference price of a
+        # percent-move alert
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(alerts)')}
+        if 'direction' not in columns:
+            cursor.execute("ALTER TABLE alerts ADD COLUMN direction TEXT NOT NULL DEFAULT 'above'")
+        if 'base_price' not in columns:
+            cursor.execute('ALTER TABLE alerts ADD COLUMN base_price REAL')
+
         cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_symbol 
                 ON alerts(symbol)
             ''')
 
-        cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_chat_symbol 
+        # One alert per (chat, symbol). Older DBs may hold duplicates, so
+        # dedupe once before the unique index can be created
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'uq_chat_symbol'"
+        )
+        if cursor.fetchone() is None:
+            cursor.execute('''
+                DELETE FROM alerts WHERE id NOT IN (
+                    SELECT MIN(id) FROM alerts GROUP BY chat_id, symbol
+                )
+            ''')
+            cursor.execute('''
+                CREATE UNIQUE INDEX uq_chat_symbol
                 ON alerts(chat_id, symbol)
             ''')
+            # Superseded by the unique index
+            cursor.execute('DROP INDEX IF EXISTS idx_chat_symbol')
+
+        # Symbol directory: tickers known to exist, so validation needs no fetch
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS symbols (
+                symbol TEXT PRIMARY KEY,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Leases in the shared DB: the Telegram poller and the live polling workers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS leases (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+        # Alert change log for sharded workers: every write to alerts, recorded by
+        # triggers so each process can replay the others' changes into its index
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alert_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                alert_id INTEGER NOT NULL,
+                chat_id INTEGER NOT NULL,
+                symbol TEXT NOT NULL,
+                target_price REAL,
+                direction TEXT,
+                deleted INTEGER NOT NULL,
+                changed_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+            )
+        ''')
+        if config.WORKER_MODE == 'all':
+            # Single process: nobody reads the log, don't pay for it on every write
+            for trigger in ('alerts_log_insert', 'alerts_log_update', 'alerts_log_delete'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        else:
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS alerts_log_insert AFTER INSERT ON alerts BEGIN
+                    INSERT INTO alert_changes (alert_id, chat_id, symbol, target_price, direction, deleted)
+                    VALUES (NEW.id, NEW.chat_id, NEW.symbol, NEW.target_price, NEW.direction, 0);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS alerts_log_update AFTER UPDATE OF target_price, direction ON alerts BEGIN
+                    INSERT INTO alert_changes (alert_id, chat_id, symbol, target_price, direction, deleted)
+                    VALUES (NEW.id, NEW.chat_id, NEW.symbol, NEW.target_price, NEW.direction, 0);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS alerts_log_delete AFTER DELETE ON alerts BEGIN
+                    INSERT INTO alert_changes (alert_id, chat_id, symbol, target_price, direction, deleted)
+                    VALUES (OLD.id, OLD.chat_id, OLD.symbol, NULL, NULL, 1);
+                END
+            ''')
+
+        # Last observed (bar time, session high, session low) per symbol, so a sharded
+        # worker taking a symbol over continues from the previous owner's last poll
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS poll_marks (
+                symbol TEXT PRIMARY KEY,
+                bar_time INTEGER NOT NULL,
+                high REAL NOT NULL,
+                low REAL NOT NULL
+            )
+        ''')
+
+        # Trigger notifications not yet delivered, written together with the alert delete
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
         self.conn.commit()
 
-    def add_alert(self, chat_id: int, symbol: str, target_price: float) -> bool:
-        """Add a new alert"""
-        try:
-            # Check if alert already exists FOR THIS USER
-            if self.alert_exists(chat_id, symbol):
-                return False
+    def _commit(self):
+        """Commit now, unless the async worker is grouping writes into one commit"""
+        if not self._batching:
+            self.conn.commit()
 
+    def add_alert(self, chat_id: int, symbol: str, target_price: float,
+                  direction: str = ABOVE, base_price: Optional[float] = None) -> bool:
+        """Add a new alert (False if this user already has one for symbol)"""
+        try:
             cursor = self.conn.cursor()
             cursor.execute(
-                'INSERT INTO alerts (chat_id, symbol, target_price) VALUES (?, ?, ?)',
-                (chat_id, symbol.upper(), target_price)
+                'INSERT INTO alerts (chat_id, symbol, target_price, direction, base_price) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT(chat_id, symbol) DO NOTHING',
+                (chat_id, symbol.upper(), target_price, direction, base_price)
             )
-            self.conn.commit()
+            if cursor.rowcount == 0:
+                return False
+            self._commit()
+            self.index.add(cursor.lastrowid, chat_id, symbol.upper(), target_price, direction)
             return True
         except Exception as e:
             print(f"Error adding alert: {e}")
             return False
 
+    def add_alerts(self, chat_id: int, alerts: List[Tuple[str, float, str, Optional[float]]]) -> Dict[str, bool]:
+        """Add many (symbol, target_price, direction, base_price) alerts in one transaction.
+
+        Returns symbol -> True (added) / False (already existed). Symbols missing
+        from the result failed with a database error.
+        """
+        outcomes = {}
+        try:
+            cursor = self.conn.cursor()
+            for symbol, target_price, direction, base_price in alerts:
+                symbol = symbol.upper()
+                if symbol in outcomes:  # Repeated symbol: first one wins
+                    continue
+                cursor.execute(
+                    'INSERT INTO alerts (chat_id, symbol, target_price, direction, base_price) '
+                    'VALUES (?, ?, ?, ?, ?) ON CONFLICT(chat_id, symbol) DO NOTHING',
+                    (chat_id, symbol, target_price, direction, base_price)
+                )
+                outcomes[symbol] = cursor.rowcount > 0
+                if cursor.rowcount > 0:
+                    self.index.add(cursor.lastrowid, chat_id, symbol, target_price, direction)
+            self._commit()
+        except Exception as e:
+            print(f"Error adding alerts: {e}")
+        return outcomes
+
     def alert_exists(self, chat_id: int, symbol: str) -> bool:
         """Check if alert already exists for THIS USER and symbol"""
         try:
@@ -89,21 +236,120 @@ class Database:
                 'DELETE FROM alerts WHERE chat_id = ? AND symbol = ?',
                 (chat_id, symbol.upper())
             )
-            self.conn.commit()
+            self._commit()
+            self.index.remove(chat_id, symbol.upper())
             return cursor.rowcount
         except Exception as e:
             print(f"Error removing alerts: {e}")
             return 0
 
-    def update_alert_by_symbol(self, chat_id: int, symbol: str, new_price: float) -> bool:
-        """Update alert price by symbol FOR THIS USER"""
+    def remove_alerts(self, chat_id: int, symbols: List[str]) -> Dict[str, int]:
+        """Remove this user's alerts for many symbols in one transaction.
+
+        Returns symbol -> number of alerts removed (0 if none existed).
+        """
+        symbols = list(dict.fromkeys(s.upper() for s in symbols))
         try:
             cursor = self.conn.cursor()
+            placeholders = ','.join('?' * len(symbols))
             cursor.execute(
-                'UPDATE alerts SET target_price = ? WHERE chat_id = ? AND symbol = ?',
-                (new_price, chat_id, symbol.upper())
+                f'SELECT symbol FROM alerts WHERE chat_id = ? AND symbol IN ({placeholders})',
+                (chat_id, *symbols)
             )
-            self.conn.commit()
+            existing = [row[0] for row in cursor.fetchall()]
+            cursor.executemany(
+                'DELETE FROM alerts WHERE chat_id = ? AND symbol = ?',
+                [(chat_id, symbol) for symbol in existing]
+            )
+            self._commit()
+            for symbol in existing:
+                self.index.remove(chat_id, symbol)
+            removed = set(existing)
+            return {symbol: int(symbol in removed) for symbol in symbols}
+        except Exception as e:
+            print(f"Error removing alerts: {e}")
+            return {}
+
+    def fire_alerts(self, alerts: List[Tuple[int, int, str, float, str, str]]) -> List[Tuple[int, Tuple]]:
+        """Move fired alerts into the outbox in one transaction.
+
+        Takes (alert_id, chat_id, symbol, target_price, direction, text) as seen
+        when the trigger was evaluated, text being its notification. An alert
+        whose target was edited in the meantime is left alone. Returns
+        (outbox_id, alert) for the alerts that were actually deleted.
+        """
+        fired = []
+        try:
+            cursor = self.conn.cursor()
+            for alert in alerts:
+                alert_id, chat_id, symbol, target_price, direction, text = alert
+                cursor.execute(
+                    'DELETE FROM alerts WHERE id = ? AND target_price = ? AND direction = ?',
+                    (alert_id, target_price, direction)
+                )
+                if cursor.rowcount > 0:
+                    cursor.execute('INSERT INTO outbox (chat_id, text) VALUES (?, ?)', (chat_id, text))
+                    fired.append((cursor.lastrowid, alert))
+            self._commit()
+        except Exception as e:
+            print(f"Error firing alerts: {e}")
+
+        # One index rebuild per symbol, not per alert: a busy symbol fires thousands at once
+        by_symbol: Dict[str, List[int]] = {}
+        for _, alert in fired:
+            by_symbol.setdefault(alert[2], []).append(alert[0])
+        for symbol, alert_ids in by_symbol.items():
+            self.index.remove_ids(symbol, alert_ids)
+        return fired
+
+    def pending_outbox(self, limit: int, exclude: Iterable[int] = (), fresh: bool = False) -> List[Tuple[int, int, str]]:
+        """Oldest undelivered notifications as (outbox_id, chat_id, text), skipping ids in exclude.
+
+        With fresh, only rows nobody has tried to send yet.
+        """
+        exclude = set(exclude)
+        cursor = self.conn.cursor()
+        cursor.execute(
+            f"SELECT id, chat_id, text FROM outbox {'WHERE attempts = 0 ' if fresh else ''}ORDER BY id LIMIT ?",
+            (limit + len(exclude),)
+        )
+        return [row for row in cursor.fetchall() if row[0] not in exclude][:limit]
+
+    def ack_outbox(self, ids: List[int]) -> int:
+        """Delete delivered notifications"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany('DELETE FROM outbox WHERE id = ?', ((i,) for i in ids))
+            self._commit()
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Error acknowledging outbox: {e}")
+            return 0
+
+    def fail_outbox(self, ids: List[int], max_attempts: int) -> int:
+        """Count a failed send; drop notifications that reached max_attempts. Returns how many were dropped"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany('UPDATE outbox SET attempts = attempts + 1 WHERE id = ?', ((i,) for i in ids))
+            cursor.execute('DELETE FROM outbox WHERE attempts >= ?', (max_attempts,))
+            self._commit()
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Error updating outbox: {e}")
+            return 0
+
+    def update_alert_by_symbol(self, chat_id: int, symbol: str, new_price: float,
+                               direction: str = ABOVE, base_price: Optional[float] = None) -> bool:
+        """Update alert price (and direction) by symbol FOR THIS USER"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'UPDATE alerts SET target_price = ?, direction = ?, base_price = ? '
+                'WHERE chat_id = ? AND symbol = ?',
+                (new_price, direction, base_price, chat_id, symbol.upper())
+            )
+            self._commit()
+            self.index.update(chat_id, symbol.upper(), new_price, direction)
             return cursor.rowcount > 0
         except Exception as e:
             print(f"Error updating alert: {e}")
@@ -117,7 +363,8 @@ class Database:
                 'DELETE FROM alerts WHERE chat_id = ?',
                 (chat_id,)
             )
-            self.conn.commit()
+            self._commit()
+            self.index.remove_chat(chat_id)
             return cursor.rowcount
         except Exception as e:
             print(f"Error clearing alerts: {e}")
@@ -126,18 +373,305 @@ class Database:
     def get_all_alerts(self) -> List[Tuple]:
         """Get all alerts"""
         cursor = self.conn.cursor()
-        cursor.execute('SELECT id, chat_id, symbol, target_price FROM alerts')
+        cursor.execute('SELECT id, chat_id, symbol, target_price, direction FROM alerts')
         return cursor.fetchall()
 
+    def load_index(self):
+        """Rebuild the trigger index straight from a cursor over the alerts table"""
+        self.index.load(self.conn.execute('SELECT id, chat_id, symbol, target_price, direction FROM alerts'))
+
+    def _last_change(self) -> int:
+        return self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM alert_changes').fetchone()[0]
+
+    def sync_index(self, limit: int = 10000) -> int:
+        """Replay alert changes made by other processes into the index; returns how many applied"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MIN(seq) FROM alert_changes')
+        oldest = cursor.fetchone()[0]
+        if oldest is not None and oldest > self._change_seq + 1 and self._change_seq > 0:
+            # Fell behind the pruned log - start over from the table
+            print(f"⚠️  Alert change log pruned past seq {self._change_seq}, reloading index")
+            self._change_seq = self._last_change()
+            self.load_index()
+            return len(self.index)
+
+        cursor.execute(
+            'SELECT seq, alert_id, chat_id, symbol, target_price, direction, deleted '
+            'FROM alert_changes WHERE seq > ? ORDER BY seq LIMIT ?',
+            (self._change_seq, limit)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+        self._change_seq = rows[-1][0]
+        return self.index.apply(row[1:] for row in rows)
+
+    def prune_changes(self, max_age: float) -> int:
+        """Drop change log entries older than max_age seconds"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "DELETE FROM alert_changes WHERE changed_at < strftime('%s', 'now') - ?", (int(max_age),)
+            )
+            self._commit()
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Error pruning alert changes: {e}")
+            return 0
+
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        """Take or renew a named lease; fails while another holder's lease is still valid"""
+        now = time.time()
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at '
+                'WHERE leases.holder = excluded.holder OR leases.expires_at < ?',
+                (name, holder, now + ttl, now)
+            )
+            self._commit()
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error acquiring lease {name}: {e}")
+            return False
+
+    def release_lease(self, name: str, holder: str):
+        """Give up a lease we hold"""
+        try:
+            self.conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+            self._commit()
+        except Exception as e:
+            print(f"Error releasing lease {name}: {e}")
+
+    def live_leases(self, prefix: str) -> List[str]:
+        """Holders of unexpired leases whose name starts with prefix"""
+        cursor = self.conn.cursor()
+        cursor.execute(
+            'SELECT holder FROM leases WHERE name LIKE ? AND expires_at >= ? ORDER BY holder',
+            (prefix + '%', time.time())
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def get_marks(self, symbols: List[str]) -> Dict[str, Tuple[int, float, float]]:
+        """Stored (bar_time, high, low) poll marks of these symbols"""
+        marks = {}
+        cursor = self.conn.cursor()
+        for start in range(0, len(symbols), 500):
+            chunk = symbols[start:start + 500]
+            cursor.execute(
+                f"SELECT symbol, bar_time, high, low FROM poll_marks WHERE symbol IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            marks.update((row[0], row[1:]) for row in cursor.fetchall())
+        return marks
+
+    def save_marks(self, marks: Dict[str, Tuple[int, float, float]]) -> int:
+        """Store poll marks, replacing each symbol's previous one"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                'INSERT INTO poll_marks (symbol, bar_time, high, low) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(symbol) DO UPDATE SET bar_time = excluded.bar_time, '
+                'high = excluded.high, low = excluded.low',
+                ((symbol, *mark) for symbol, mark in marks.items())
+            )
+            self._commit()
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Error saving poll marks: {e}")
+            return 0
+
     def get_user_alerts(self, chat_id: int) -> List[Tuple]:
         """Get all alerts for a specific user"""
         cursor = self.conn.cursor()
         cursor.execute(
-            'SELECT id, symbol, target_price FROM alerts WHERE chat_id = ? ORDER BY symbol',
+            'SELECT id, symbol, target_price, direction, base_price FROM alerts WHERE chat_id = ? ORDER BY symbol',
             (chat_id,)
         )
         return cursor.fetchall()
 
+    def get_symbols(self) -> List[str]:
+        """Known symbols: the directory plus every symbol that has an alert"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT symbol FROM symbols UNION SELECT DISTINCT symbol FROM alerts')
+        return [row[0] for row in cursor.fetchall()]
+
+    def save_symbols(self, symbols: Iterable[str], replace: bool = False) -> int:
+        """Store known symbols; with replace, the given list becomes the whole directory"""
+        try:
+            cursor = self.conn.cursor()
+            if replace:
+                cursor.execute('DELETE FROM symbols')
+            cursor.executemany(
+                'INSERT INTO symbols (symbol) VALUES (?) ON CONFLICT(symbol) DO NOTHING',
+                ((symbol,) for symbol in symbols)
+            )
+            self._commit()
+            return cursor.rowcount
+        except Exception as e:
+            print(f"Error saving symbols: {e}")
+            return 0
+
     def close(self):
         """Close database connection"""
         self.conn.close()
+
+
+class AsyncDatabase:
+    """Awaitable facade over Database, served by one dedicated DB thread.
+
+    Calls are queued to the worker so sqlite I/O never runs on the event loop.
+    Writes that pile up while the worker is busy run back to back and share a
+    single commit (group commit); callers are resolved only after that commit.
+    """
+
+    def __init__(self, db: Optional[Database] = None, max_batch: int = 256):
+        self.db = db or Database()
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='db-worker', daemon=True)
+        self._thread.start()
+
+    @property
+    def index(self):
+        return self.db.index
+
+    def _submit(self, write: bool, fn, *args) -> "asyncio.Future":
+        future = concurrent.futures.Future()
+        self._queue.put((write, fn, args, future))
+        return asyncio.wrap_future(future)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            # Drain whatever queued up meanwhile into the same batch
+            batch = [job]
+            while len(batch) < self.max_batch:
+                try:
+                    job = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._queue.put(None)  # Finish this batch, then stop
+                    break
+                batch.append(job)
+
+            self._execute(batch)
+
+    def _execute(self, batch: List[Tuple]):
+        results = []
+        has_writes = False
+
+        self.db._batching = True
+        try:
+            for write, fn, args, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                has_writes = has_writes or write
+                started = time.perf_counter()
+                try:
+                    results.append((future, fn(*args), None))
+                except Exception as e:
+                    results.append((future, None, e))
+                metrics.DB_STATEMENT_SECONDS.observe(time.perf_counter() - started, labels=(fn.__name__,))
+        finally:
+            self.db._batching = False
+
+        if has_writes:
+            started = time.perf_counter()
+            try:
+                self.db.conn.commit()
+                metrics.DB_STATEMENT_SECONDS.observe(time.perf_counter() - started, labels=('commit',))
+            except Exception as e:
+                print(f"Error committing batch of {len(batch)}: {e}")
+                self.db.conn.rollback()
+                # The index already applied these writes - resync it from disk
+                self.db.load_index()
+                for future, _, _ in results:
+                    future.set_exception(e)
+                return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def add_alert(self, chat_id: int, symbol: str, target_price: float,
+                        direction: str = ABOVE, base_price: Optional[float] = None) -> bool:
+        return await self._submit(True, self.db.add_alert, chat_id, symbol, target_price, direction, base_price)
+
+    async def add_alerts(self, chat_id: int, alerts: List[Tuple[str, float, str, Optional[float]]]) -> Dict[str, bool]:
+        return await self._submit(True, self.db.add_alerts, chat_id, alerts)
+
+    async def alert_exists(self, chat_id: int, symbol: str) -> bool:
+        return await self._submit(False, self.db.alert_exists, chat_id, symbol)
+
+    async def remove_alerts_by_symbol(self, chat_id: int, symbol: str) -> int:
+        return await self._submit(True, self.db.remove_alerts_by_symbol, chat_id, symbol)
+
+    async def remove_alerts(self, chat_id: int, symbols: List[str]) -> Dict[str, int]:
+        return await self._submit(True, self.db.remove_alerts, chat_id, symbols)
+
+    async def fire_alerts(self, alerts: List[Tuple[int, int, str, float, str, str]]) -> List[Tuple[int, Tuple]]:
+        return await self._submit(True, self.db.fire_alerts, alerts)
+
+    async def pending_outbox(self, limit: int, exclude: Iterable[int] = (), fresh: bool = False) -> List[Tuple[int, int, str]]:
+        return await self._submit(False, self.db.pending_outbox, limit, list(exclude), fresh)
+
+    async def ack_outbox(self, ids: List[int]) -> int:
+        return await self._submit(True, self.db.ack_outbox, ids)
+
+    async def fail_outbox(self, ids: List[int], max_attempts: int) -> int:
+        return await self._submit(True, self.db.fail_outbox, ids, max_attempts)
+
+    async def update_alert_by_symbol(self, chat_id: int, symbol: str, new_price: float,
+                                     direction: str = ABOVE, base_price: Optional[float] = None) -> bool:
+        return await self._submit(True, self.db.update_alert_by_symbol, chat_id, symbol, new_price,
+                                  direction, base_price)
+
+    async def clear_user_alerts(self, chat_id: int) -> int:
+        return await self._submit(True, self.db.clear_user_alerts, chat_id)
+
+    async def get_all_alerts(self) -> List[Tuple]:
+        return await self._submit(False, self.db.get_all_alerts)
+
+    async def get_user_alerts(self, chat_id: int) -> List[Tuple]:
+        return await self._submit(False, self.db.get_user_alerts, chat_id)
+
+    async def get_symbols(self) -> List[str]:
+        return await self._submit(False, self.db.get_symbols)
+
+    async def sync_index(self) -> int:
+        return await self._submit(False, self.db.sync_index)
+
+    async def prune_changes(self, max_age: float) -> int:
+        return await self._submit(True, self.db.prune_changes, max_age)
+
+    async def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        return await self._submit(True, self.db.acquire_lease, name, holder, ttl)
+
+    async def release_lease(self, name: str, holder: str):
+        return await self._submit(True, self.db.release_lease, name, holder)
+
+    async def live_leases(self, prefix: str) -> List[str]:
+        return await self._submit(False, self.db.live_leases, prefix)
+
+    async def save_symbols(self, symbols: Iterable[str], replace: bool = False) -> int:
+        return await self._submit(True, self.db.save_symbols, list(symbols), replace)
+
+    async def get_marks(self, symbols: Iterable[str]) -> Dict[str, Tuple[int, float, float]]:
+        return await self._submit(False, self.db.get_marks, list(symbols))
+
+    async def save_marks(self, marks: Dict[str, Tuple[int, float, float]]) -> int:
+        return await self._submit(True, self.db.save_marks, dict(marks))
+
+    def close(self):
+        """Finish queued work, stop the worker and close the connection"""
+        self._queue.put(None)
+        self._thread.join()
+        self.db.close()
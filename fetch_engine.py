@@ -0,0 +1,126 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+import metrics
+
+
+class AdaptiveLimiter:
+    """Concurrency limit with AIMD control.
+
+    The limit grows by ~1 per window of successful requests and halves when
+    upstream throttles (429/5xx), so the batch settles at the highest rate
+    Vietstock accepts. A throttle also pauses new requests for the backoff delay.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._pause_until = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        # Honour backoff before taking a slot
+        delay = self._pause_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._pause_until - time.monotonic()
+
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self, delay: float):
+        now = time.monotonic()
+        # A burst of 429s from one overload episode only halves the limit once
+        if now >= self._pause_until:
+            self.limit = max(self.min_limit, self.limit / 2)
+        self._pause_until = max(self._pause_until, now + delay)
+
+
+class FetchEngine:
+    """Pooled, rate-limited HTTP client for the upstream price API"""
+
+    def __init__(self, headers: Dict[str, str], max_concurrency: int = 16, max_retries: int = 3,
+                 timeout: float = 10, backoff_base: float = 0.5):
+        self.headers = headers
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.limiter = AdaptiveLimiter(max_concurrency)
+
+    def init_session(self):
+        """Create the session with a bounded keep-alive pool and DNS cache"""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.max_concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            self.session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff_base * (2 ** attempt) * (1 + random.random())
+
+    async def get_json(self, url: str, params: Dict[str, Any]) -> Optional[Any]:
+        """GET a JSON document, retrying with backoff on 429/5xx and network errors"""
+        self.init_session()
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            try:
+                async with self.session.get(url, params=params) as response:
+                    metrics.UPSTREAM_RESPONSES.inc(labels=(str(response.status),))
+
+                    if response.status == 200:
+                        self.limiter.on_success()
+                        return await response.json(content_type=None)
+
+                    if response.status == 429 or response.status >= 500:
+                        delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                        self.limiter.on_throttle(delay)
+                        print(f"⚠️  Upstream {response.status} for {params.get('symbol')}, "
+                              f"backing off {delay:.1f}s (limit={int(self.limiter.limit)})")
+                        continue
+
+                    text = await response.text()
+                    print(f"🔍 DEBUG: Error response: {text[:200]}")
+                    return None
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.UPSTREAM_RESPONSES.inc(labels=('error',))
+                self.limiter.on_throttle(self._backoff(attempt))
+                print(f"⚠️  Request error for {params.get('symbol')}: {e!r}")
+            finally:
+                await self.limiter.release()
+
+        return None
@@ -0,0 +1,361 @@
+"""Load test for the interactive command path.
+
+Runs the real command handlers inside a python-telegram-bot Application that
+polls a local fake Bot API server. The server replays a mix of commands from
+many chats at a target rate. Prices come from the benchmark's fake Vietstock
+server and the alerts DB is a throwaway file.
+
+    python loadtest.py --rate 50 --duration 30 --chats 500
+    python loadtest.py --mix "alert=3,list=3,price=3,edit=1,remove=1" --latency 80
+    python loadtest.py --concurrency 0                   # one update at a time, for comparison
+    python loadtest.py --reply-rate 0                    # handlers alone, without Telegram's 30 msg/s
+
+Reports throughput, end-to-end latency (update queued -> handler done),
+queueing delay, and per-command time spent in DB, price fetch and Bot API replies.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from benchmark import FakeVietstock, percentile
+
+# Per-update timing buckets, visible to every task spawned while handling it
+current_timings: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar('current_timings', default=None)
+
+
+class FakeBotAPI:
+    """Minimal local Telegram Bot API: serves queued updates via getUpdates, accepts replies"""
+
+    def __init__(self, reply_latency_ms: float = 0):
+        self.reply_latency = reply_latency_ms / 1000
+        self.updates: List[Dict] = []
+        self.new_update = asyncio.Event()
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.submitted_at: Dict[int, float] = {}
+        self.replies = 0
+        self._runner = None
+
+    def push(self, chat_id: int, text: str) -> int:
+        update_id = self.next_update_id
+        self.next_update_id += 1
+        command = text.split()[0]
+        self.updates.append({
+            'update_id': update_id,
+            'message': {
+                'message_id': self._message_id(),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f'user{chat_id}'},
+                'text': text,
+                'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(command)}],
+            },
+        })
+        self.submitted_at[update_id] = time.perf_counter()
+        self.new_update.set()
+        return update_id
+
+    def _message_id(self) -> int:
+        self.next_message_id += 1
+        return self.next_message_id
+
+    def _ok(self, result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post()) if request.can_read_body else {}
+
+        if method == 'getMe':
+            return self._ok({'id': 1, 'is_bot': True, 'first_name': 'LoadTest', 'username': 'loadtest_bot'})
+
+        if method == 'getUpdates':
+            offset = int(params.get('offset', 0) or 0)
+            timeout = float(params.get('timeout', 0) or 0)
+            self.updates = [u for u in self.updates if u['update_id'] >= offset]
+            if not self.updates and timeout:
+                self.new_update.clear()
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._ok(self.updates[:100])
+
+        if method in ('sendMessage', 'editMessageText'):
+            if self.reply_latency:
+                await asyncio.sleep(self.reply_latency)
+            self.replies += 1
+            chat_id = int(params.get('chat_id', 0))
+            return self._ok({
+                'message_id': int(params.get('message_id', 0)) or self._message_id(),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': params.get('text', ''),
+            })
+
+        # setMyCommands, deleteWebhook, answerCallbackQuery, ...
+        return self._ok(True)
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f'http://127.0.0.1:{port}/bot'
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+def add_time(bucket: str, elapsed: float):
+    timings = current_timings.get()
+    if timings is not None:
+        timings[bucket] += elapsed
+
+
+def timed_async(fn, bucket: str):
+    async def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            add_time(bucket, time.perf_counter() - t0)
+    return wrapper
+
+
+def timed_wall(fn, bucket: str):
+    """Count wall time once even when several calls overlap (e.g. a batch of price fetches)"""
+    async def wrapper(*args, **kwargs):
+        timings = current_timings.get()
+        if timings is None:
+            return await fn(*args, **kwargs)
+        active = timings.setdefault(f'_{bucket}_active', 0)
+        if active == 0:
+            timings[f'_{bucket}_start'] = time.perf_counter()
+        timings[f'_{bucket}_active'] = active + 1
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            timings[f'_{bucket}_active'] -= 1
+            if timings[f'_{bucket}_active'] == 0:
+                timings[bucket] += time.perf_counter() - timings[f'_{bucket}_start']
+    return wrapper
+
+
+def make_condition(rng: random.Random) -> str:
+    """Random alert condition: price above, price below or percent move"""
+    price = round(rng.uniform(10, 100), 1)
+    return rng.choice([f'{price}', f'<{price}', f'{rng.choice("+-")}{rng.randint(1, 10)}%'])
+
+
+def make_command(rng: random.Random, kind: str, symbols: List[str]) -> str:
+    symbol = rng.choice(symbols)
+    if kind == 'alert':
+        if rng.random() < 0.2:
+            pairs = rng.sample(symbols, k=min(5, len(symbols)))
+            return '/alert ' + ' '.join(f'{s} {make_condition(rng)}' for s in pairs)
+        return f'/alert {symbol} {make_condition(rng)}'
+    if kind == 'edit':
+        return f'/edit {symbol} {make_condition(rng)}'
+    if kind == 'remove':
+        return f'/remove {symbol}'
+    if kind == 'price':
+        return f'/price {symbol}'
+    return f'/{kind}'
+
+
+async def run(args) -> Dict:
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+    from telegram.request import HTTPXRequest
+
+    vietstock = FakeVietstock(args.latency)
+    import config
+    config.VIETSTOCK_API_URL = await vietstock.start()
+
+    import bot
+    from notifier import ReplyRateLimiter, TokenBucket
+    from update_processor import PerChatUpdateProcessor
+    logging.getLogger('aiohttp.access').setLevel(logging.WARNING)
+
+    api = FakeBotAPI(args.reply_latency)
+    base_url = await api.start()
+
+    # Instrument the three places a handler spends time
+    bot.price_checker.get_bars = timed_wall(bot.price_checker.get_bars, 'price')
+    bot.db._submit = timed_async(bot.db._submit, 'db')
+
+    class TimedRequest(HTTPXRequest):
+        async def do_request(self, *a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return await super().do_request(*a, **kw)
+            finally:
+                add_time('reply', time.perf_counter() - t0)
+
+    builder = (
+        Application.builder()
+        .token('loadtest')
+        .base_url(base_url)
+        .request(TimedRequest(connection_pool_size=64))
+    )
+    if args.concurrency > 0:
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(args.concurrency))
+    if args.reply_rate > 0:
+        bot.dispatcher.global_bucket = TokenBucket(args.reply_rate, args.reply_rate)
+        builder = builder.rate_limiter(ReplyRateLimiter(bot.dispatcher))
+    application = builder.build()
+    bot.bot_app = application
+
+    samples: List[Dict] = []
+
+    async def begin(update: Update, context):
+        current_timings.set({
+            'update_id': update.update_id,
+            'command': update.message.text.split()[0] if update.message else '?',
+            'started': time.perf_counter(),
+            'db': 0.0, 'price': 0.0, 'reply': 0.0,
+        })
+
+    async def finish(update: Update, context):
+        timings = current_timings.get()
+        if timings is None:
+            return
+        timings['finished'] = time.perf_counter()
+        timings['submitted'] = api.submitted_at.pop(update.update_id, timings['started'])
+        samples.append(timings)
+
+    application.add_handler(TypeHandler(Update, begin), group=-1)
+    bot.add_handlers(application)
+    application.add_handler(TypeHandler(Update, finish), group=1)
+
+    await application.initialize()
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=1)
+
+    # Replay the command mix at the target rate
+    rng = random.Random(1)
+    mix = {}
+    for part in args.mix.split(','):
+        kind, weight = part.split('=')
+        mix[kind.strip()] = float(weight)
+    kinds, weights = list(mix), list(mix.values())
+    symbols = [f'S{i:04d}' for i in range(args.symbols)]
+    chats = [200000 + i for i in range(args.chats)]
+
+    total = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for n in range(total):
+        delay = started + n / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        api.push(rng.choice(chats), make_command(rng, rng.choices(kinds, weights)[0], symbols))
+
+    deadline = time.perf_counter() + args.drain_timeout
+    while len(samples) < total and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await bot.price_checker.close_session()
+    await api.stop()
+    await vietstock.stop()
+
+    by_command = defaultdict(list)
+    for sample in samples:
+        by_command[sample['command']].append(sample)
+
+    def summarize(group: List[Dict]) -> Dict:
+        end_to_end = [s['finished'] - s['submitted'] for s in group]
+        return {
+            'count': len(group),
+            'p50_ms': percentile(end_to_end, 50) * 1000,
+            'p95_ms': percentile(end_to_end, 95) * 1000,
+            'p99_ms': percentile(end_to_end, 99) * 1000,
+            'queue_ms': sum(s['started'] - s['submitted'] for s in group) / len(group) * 1000,
+            'db_ms': sum(s['db'] for s in group) / len(group) * 1000,
+            'price_ms': sum(s['price'] for s in group) / len(group) * 1000,
+            'reply_ms': sum(s['reply'] for s in group) / len(group) * 1000,
+        }
+
+    return {
+        'submitted': total,
+        'completed': len(samples),
+        'elapsed_s': elapsed,
+        'throughput': len(samples) / elapsed if elapsed else 0.0,
+        'overall': summarize(samples) if samples else {},
+        'commands': {command: summarize(group) for command, group in sorted(by_command.items())},
+    }
+
+
+def print_report(result: Dict):
+    print(f"\n📨 {result['completed']}/{result['submitted']} updates in {result['elapsed_s']:.1f}s "
+          f"→ {result['throughput']:.1f} updates/s\n")
+    print(f"{'command':<10} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'queue':>8} "
+          f"{'db':>7} {'price':>7} {'reply':>7}")
+    rows = dict(result['commands'])
+    if result['overall']:
+        rows['ALL'] = result['overall']
+    for command, row in rows.items():
+        print(f"{command:<10} {row['count']:>6} {row['p50_ms']:>6.0f}ms {row['p95_ms']:>6.0f}ms "
+              f"{row['p99_ms']:>6.0f}ms {row['queue_ms']:>6.0f}ms {row['db_ms']:>5.1f}ms "
+              f"{row['price_ms']:>5.0f}ms {row['reply_ms']:>5.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the command handlers via a fake Bot API")
+    parser.add_argument('--rate', type=float, default=50, help="updates per second")
+    parser.add_argument('--duration', type=float, default=20, help="seconds of replay")
+    parser.add_argument('--chats', type=int, default=300)
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--mix', default='alert=2,list=3,price=3,edit=1,remove=1')
+    parser.add_argument('--latency', type=float, default=50, help="mean Vietstock latency (ms)")
+    parser.add_argument('--reply-latency', type=float, default=30, help="fake Bot API latency (ms)")
+    parser.add_argument('--drain-timeout', type=float, default=60)
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help="updates handled at once (default MAX_CONCURRENT_UPDATES, 0 = one at a time)")
+    parser.add_argument('--reply-rate', type=float, default=None,
+                        help="bot-wide send budget in msg/s (default NOTIFY_GLOBAL_RATE, 0 = unlimited)")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    # Configure before the bot modules are imported
+    os.environ.setdefault('BOT_TOKEN', 'loadtest')
+    tmp = tempfile.TemporaryDirectory()
+    import config
+    config.DATABASE_FILE = os.path.join(tmp.name, 'alerts.db')
+    if args.concurrency is None:
+        args.concurrency = config.MAX_CONCURRENT_UPDATES
+    if args.reply_rate is None:
+        args.reply_rate = config.NOTIFY_GLOBAL_RATE
+
+    result = asyncio.run(run(args))
+    print_report(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\n💾 Results saved to {args.json}")
+
+    sys.exit(0 if result['completed'] == result['submitted'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Minimal Prometheus-style metrics, cheap enough for the hot loop.
+
+Each observation is a dict lookup, a bisect over a short bucket list and a
+few additions under a per-metric lock. Rendering happens only when /metrics
+is scraped.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: Tuple = ()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time.
+
+    The callback returns a number, or a {label values tuple: number} dict.
+    """
+
+    def __init__(self, name: str, documentation: str, fn: Callable[[], Union[float, Dict[Tuple, float]]],
+                 labelnames: Sequence[str] = (), kind: str = 'gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        try:
+            value = self.fn()
+        except Exception as e:
+            print(f"Error collecting metric {self.name}: {e}")
+            return lines
+        values = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, number in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(number)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple = ()):
+        pos = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[pos] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Hot-path metrics, recorded where the work happens
+CHECK_CYCLE_SECONDS = REGISTRY.register(Histogram(
+    'stockbot_check_cycle_seconds', 'Wall time of one alert check cycle'))
+FETCH_SECONDS = REGISTRY.register(Histogram(
+    'stockbot_fetch_seconds', 'Per-symbol price fetch latency, including retries'))
+UPSTREAM_RESPONSES = REGISTRY.register(Counter(
+    'stockbot_upstream_responses_total', 'Vietstock responses by HTTP status', ('status',)))
+PIPELINE_LAG_SECONDS = REGISTRY.register(Histogram(
+    'stockbot_pipeline_lag_seconds', 'How long work waited before a polling pipeline stage picked it up '
+    '(fetch: cycle start behind schedule)', ('stage',)))
+TRIGGERS_FIRED = REGISTRY.register(Counter(
+    'stockbot_triggers_fired_total', 'Alerts that crossed their target and were removed'))
+NOTIFICATION_SEND_SECONDS = REGISTRY.register(Histogram(
+    'stockbot_notification_send_seconds', 'Telegram send_message latency', ('result',)))
+OUTBOX_DELIVERED = REGISTRY.register(Counter(
+    'stockbot_outbox_delivered_total', 'Trigger notifications delivered and acknowledged in the outbox'))
+OUTBOX_DROPPED = REGISTRY.register(Counter(
+    'stockbot_outbox_dropped_total', 'Trigger notifications given up on after repeated failed sends'))
+NOTIFICATIONS_COALESCED = REGISTRY.register(Counter(
+    'stockbot_notifications_coalesced_total', 'Notification texts merged into another message for the same chat'))
+NOTIFICATION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'stockbot_notification_wait_seconds', 'Time a notification spent queued before delivery'))
+DB_STATEMENT_SECONDS = REGISTRY.register(Histogram(
+    'stockbot_db_statement_seconds', 'Time spent in Database calls on the DB worker', ('method',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)))
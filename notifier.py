@@ -0,0 +1,306 @@
+import asyncio
+import contextvars
+import itertools
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.constants import MessageLimit
+from telegram.error import Forbidden, BadRequest, NetworkError, RetryAfter, TelegramError
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+# Lower value = sent first
+PRIORITY_TRIGGER = 0
+PRIORITY_NORMAL = 1
+
+# Set inside dispatcher workers, whose sends are already charged to the global bucket
+_dispatching = contextvars.ContextVar('dispatching', default=False)
+
+
+class TokenBucket:
+    """Reservation-style token bucket: reserve() says how long to wait for the token"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Push the next free token `seconds` into the future (Telegram flood control)"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+def text_length(text: str) -> int:
+    """Length as Telegram counts it (UTF-16 code units, so most emoji count twice)"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+class _Message:
+    """One outgoing send_message: a single text, or several grouped texts for one chat"""
+
+    __slots__ = ('chat_id', 'parts', 'group', 'parse_mode', 'futures', 'enqueued_at', 'size')
+
+    def __init__(self, chat_id: int, text: str, parse_mode: Optional[str], future: asyncio.Future,
+                 group: Optional[Tuple[str, str]] = None):
+        self.chat_id = chat_id
+        self.parts = [text]
+        self.group = group
+        self.parse_mode = parse_mode
+        self.futures = [future]
+        self.enqueued_at = time.monotonic()
+        self.size = text_length(text) + (text_length(group[0] + group[1]) if group else 0)
+
+    def fits(self, text: str) -> bool:
+        return self.size + text_length(text) + 1 <= MessageLimit.MAX_TEXT_LENGTH
+
+    def add(self, text: str, future: asyncio.Future):
+        self.parts.append(text)
+        self.futures.append(future)
+        self.size += text_length(text) + 1
+
+    @property
+    def text(self) -> str:
+        if self.group is None:
+            return self.parts[0]
+        header, footer = self.group
+        return header + '\n'.join(self.parts) + footer
+
+    def resolve(self, delivered: bool):
+        for future in self.futures:
+            if not future.done():
+                future.set_result(delivered)
+
+
+class NotificationDispatcher:
+    """Queue + concurrent workers for outgoing Telegram messages.
+
+    Sends respect Telegram's global (~30 msg/s) and per-chat (~1 msg/s) limits
+    through token buckets, honour RetryAfter, and trigger notifications jump
+    ahead of lower-priority messages. Callers enqueue and move on.
+
+    Grouped messages for the same chat are merged into one send while they
+    wait: held for `coalesce_window` seconds, then until a worker actually
+    sends them, so a burst of triggers costs one API call per chat.
+    """
+
+    def __init__(self, workers: int = 8, global_rate: float = 30, chat_rate: float = 1,
+                 max_retries: int = 3, coalesce_window: float = 0):
+        self.num_workers = workers
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.coalesce_window = coalesce_window
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_buckets: Dict[int, TokenBucket] = {}
+        self.bot = None
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._workers = []
+        # (chat_id, group) -> grouped message still open for more texts
+        self._open: Dict[Tuple[int, Tuple[str, str]], _Message] = {}
+        # Grouped messages held for the coalescing window, not yet queued
+        self._held: Dict[_Message, asyncio.TimerHandle] = {}
+
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+
+    def start(self, bot):
+        """Spawn worker tasks on the running loop"""
+        self.bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        for message, handle in self._held.items():
+            handle.cancel()
+            for future in message.futures:
+                future.cancel()
+        self._held = {}
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def join(self):
+        """Wait until every held and queued message has been handled"""
+        while True:
+            await self._queue.join()
+            if not self._held:
+                return
+            await asyncio.sleep(self.coalesce_window)
+
+    def qsize(self) -> int:
+        return (self._queue.qsize() if self._queue else 0) + len(self._held)
+
+    def enqueue(self, chat_id: int, text: str, priority: int = PRIORITY_NORMAL,
+                parse_mode: Optional[str] = 'Markdown', group: Optional[Tuple[str, str]] = None) -> asyncio.Future:
+        """Queue a message; the returned future resolves to True once delivered.
+
+        Texts with the same `group` (header, footer) for a chat that haven't
+        been sent yet go out as one message: header, the texts, then footer.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        if group is not None:
+            message = self._open.get((chat_id, group))
+            if message is not None and message.fits(text):
+                message.add(text, future)
+                self.coalesced += 1
+                metrics.NOTIFICATIONS_COALESCED.inc()
+                return future
+
+        message = _Message(chat_id, text, parse_mode, future, group)
+        if group is None:
+            self._put(priority, message)
+            return future
+
+        self._open[(chat_id, group)] = message
+        if self.coalesce_window > 0:
+            self._held[message] = asyncio.get_running_loop().call_later(
+                self.coalesce_window, self._release, priority, message
+            )
+        else:
+            self._put(priority, message)
+        return future
+
+    def _put(self, priority: int, message: _Message):
+        self._queue.put_nowait((priority, next(self._seq), message))
+
+    def _release(self, priority: int, message: _Message):
+        """Coalescing window over - queue the message (it still takes texts until sent)"""
+        del self._held[message]
+        self._put(priority, message)
+
+    def _seal(self, message: _Message):
+        """Stop adding texts to a message that is about to be sent"""
+        key = (message.chat_id, message.group)
+        if self._open.get(key) is message:
+            del self._open[key]
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            # Keep the map bounded: forget chats whose bucket has fully refilled
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.is_idle()}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    async def _worker(self):
+        _dispatching.set(True)
+        while True:
+            _, _, message = await self._queue.get()
+            try:
+                delivered = await self._deliver(message)
+                if delivered:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                message.resolve(delivered)
+            except asyncio.CancelledError:
+                self._seal(message)
+                for future in message.futures:
+                    future.cancel()
+                raise
+            except Exception as e:
+                print(f"Error dispatching message to {message.chat_id}: {e}")
+                self._seal(message)
+                message.resolve(False)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, message: _Message) -> bool:
+        chat_bucket = self._chat_bucket(message.chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            # Per-chat first, so a busy chat doesn't burn global tokens while waiting
+            delay = chat_bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            delay = self.global_bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if attempt == 0:
+                # Texts that arrived while we waited for tokens ride along
+                self._seal(message)
+                metrics.NOTIFICATION_WAIT_SECONDS.observe(time.monotonic() - message.enqueued_at)
+
+            started = time.perf_counter()
+            try:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    parse_mode=message.parse_mode
+                )
+                metrics.NOTIFICATION_SEND_SECONDS.observe(time.perf_counter() - started, labels=('ok',))
+                return True
+            except RetryAfter as e:
+                metrics.NOTIFICATION_SEND_SECONDS.observe(time.perf_counter() - started, labels=('retry_after',))
+                print(f"⚠️  Flood control for chat {message.chat_id}, retry in {e.retry_after}s")
+                # Flood control is bot-wide: hold every other chat's sends too
+                chat_bucket.pause(e.retry_after)
+                self.global_bucket.pause(e.retry_after)
+            except (Forbidden, BadRequest) as e:
+                metrics.NOTIFICATION_SEND_SECONDS.observe(time.perf_counter() - started, labels=('rejected',))
+                # User blocked the bot / bad markup - retrying won't help
+                print(f"Error sending notification to {message.chat_id}: {e}")
+                return False
+            except (NetworkError, TelegramError) as e:
+                metrics.NOTIFICATION_SEND_SECONDS.observe(time.perf_counter() - started, labels=('error',))
+                print(f"Error sending notification to {message.chat_id} (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(2 ** attempt)
+
+        return False
+
+
+class ReplyRateLimiter(BaseRateLimiter):
+    """Charges the dispatcher's global bucket for messages handlers send themselves.
+
+    Command replies and edits go straight to Telegram rather than through the
+    dispatcher queue, but count against the same bot-wide ~30 msg/s limit as
+    trigger notifications. Sends made by the dispatcher pass through as is.
+    """
+
+    def __init__(self, dispatcher: NotificationDispatcher):
+        self.dispatcher = dispatcher
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def process_request(self, callback, args, kwargs, endpoint: str, data: Dict[str, Any],
+                              rate_limit_args: Optional[Any]):
+        if _dispatching.get() or not endpoint.startswith(('send', 'edit')):
+            return await callback(*args, **kwargs)
+
+        delay = self.dispatcher.global_bucket.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            return await callback(*args, **kwargs)
+        except RetryAfter as e:
+            # Flood control is bot-wide: hold the notifications too
+            self.dispatcher.global_bucket.pause(e.retry_after)
+            raise
@@ -0,0 +1,114 @@
+import asyncio
+from typing import List, Optional, Set, Tuple
+
+import metrics
+from notifier import PRIORITY_TRIGGER, NotificationDispatcher
+
+
+class OutboxDrainer:
+    """Delivers trigger notifications persisted in the outbox table.
+
+    Fired alerts are moved into the outbox in the same transaction that
+    deletes them, so a crash can't lose a trigger or fire it twice from the
+    alerts table. Rows go to the dispatcher straight away and are deleted
+    (acknowledged) once Telegram accepted them; acks and failures are
+    written back in batches every `interval` seconds. Rows left over from a
+    crash or a failed send are picked up again on the next pass, until
+    `max_attempts` sends have failed.
+
+    With `scan_fresh`, new rows are also looked for on every pass, for
+    rows written by polling workers in other processes.
+
+    A crash between a send and its ack re-sends that message on restart:
+    delivery is at least once, with the window narrowed to one ack batch.
+    """
+
+    def __init__(self, db, dispatcher: NotificationDispatcher, group: Optional[Tuple[str, str]] = None,
+                 interval: float = 1, retry_interval: float = 30, max_attempts: int = 5,
+                 batch_size: int = 500, scan_fresh: bool = False):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.group = group
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.scan_fresh = scan_fresh
+        # Outbox ids handed to the dispatcher and not yet resolved
+        self._inflight: Set[int] = set()
+        self._acks: List[int] = []
+        self._failures: List[int] = []
+        # Resolved ids whose rows are still in the table until their flush completes
+        self._unflushed: Set[int] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Resume pending rows and keep flushing acks in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop draining and write back whatever has been resolved so far"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def pending(self) -> int:
+        return len(self._inflight)
+
+    def deliver(self, rows: List[Tuple[int, int, str]]):
+        """Send committed outbox rows: (outbox_id, chat_id, text)"""
+        for outbox_id, chat_id, text in rows:
+            # Rows read before a send resolved can come back after it: skip both
+            if outbox_id in self._inflight or outbox_id in self._unflushed:
+                continue
+            self._inflight.add(outbox_id)
+            future = self.dispatcher.enqueue(chat_id, text, priority=PRIORITY_TRIGGER, group=self.group)
+            future.add_done_callback(lambda f, outbox_id=outbox_id: self._resolved(outbox_id, f))
+
+    def _resolved(self, outbox_id: int, future: asyncio.Future):
+        self._inflight.discard(outbox_id)
+        if future.cancelled():
+            return  # Shutting down - the row stays for the next start
+        self._unflushed.add(outbox_id)
+        if future.exception() is None and future.result():
+            self._acks.append(outbox_id)
+        else:
+            self._failures.append(outbox_id)
+
+    async def flush(self):
+        """Write back resolved rows: acks are deleted, failures count an attempt"""
+        acks, self._acks = self._acks, []
+        failures, self._failures = self._failures, []
+        try:
+            if acks:
+                await self.db.ack_outbox(acks)
+                metrics.OUTBOX_DELIVERED.inc(len(acks))
+            if failures:
+                dropped = await self.db.fail_outbox(failures, self.max_attempts)
+                if dropped:
+                    metrics.OUTBOX_DROPPED.inc(dropped)
+                    print(f"⚠️  Dropped {dropped} notifications after {self.max_attempts} failed attempts")
+        finally:
+            # Written back (or left for the retry pass): a later scan sees the table as it is
+            self._unflushed.difference_update(acks)
+            self._unflushed.difference_update(failures)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_scan = loop.time()
+        while True:
+            try:
+                await self.flush()
+                busy = self._inflight | self._unflushed
+                if loop.time() >= next_scan:
+                    # Startup backlog and failed sends waiting for another try
+                    self.deliver(await self.db.pending_outbox(self.batch_size, exclude=busy))
+                    next_scan = loop.time() + self.retry_interval
+                elif self.scan_fresh:
+                    self.deliver(await self.db.pending_outbox(self.batch_size, exclude=busy, fresh=True))
+            except Exception as e:
+                print(f"Error draining outbox: {e}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import metrics
+from bars import Quote
+
+logger = logging.getLogger(__name__)
+
+
+class AlertPipeline:
+    """Long-lived fetch -> evaluate -> deliver pipeline for price alerts.
+
+    - fetch: every `interval` seconds, streams quotes for the symbols the poll
+      scheduler says are due. A slow cycle delays the next one instead of
+      skipping it.
+    - evaluate: matches each quote against the trigger index, plans the
+      symbol's next poll and renders notifications for crossed alerts.
+    - deliver: moves fired alerts into the outbox, batching whatever queued
+      up meanwhile into one write, and hands the rows to the outbox drainer.
+
+    Stages are joined by bounded queues: a stalled DB or Telegram fills the
+    queues and only then slows price acquisition. Each stage reports how
+    long its input waited (stockbot_pipeline_lag_seconds).
+
+    When sharded, the session high/low marks of evaluated quotes are shared
+    through the DB at the start of each cycle, so a worker taking a symbol
+    over evaluates the range traded since its previous owner's last poll.
+    """
+
+    def __init__(self, db, price_checker, poll_scheduler, outbox,
+                 render: Callable[[str, str, float, Quote], str], interval: float,
+                 queue_size: int = 256, is_open: Callable[[], bool] = lambda: True,
+                 owns: Optional[Callable[[str], bool]] = None):
+        self.db = db
+        self.price_checker = price_checker
+        self.poll_scheduler = poll_scheduler
+        self.outbox = outbox
+        self.render = render
+        self.interval = interval
+        self.is_open = is_open
+        # Sharded workers only poll the symbols they own; outbox is None when
+        # another process delivers the notifications
+        self.owns = owns
+        self.queue_size = queue_size
+        # (symbol, quote, queued_at); created with the stages, inside the running loop
+        self._quotes: Optional[asyncio.Queue] = None
+        # (symbol, [(alert_id, chat_id, symbol, target_price, direction, text)], queued_at)
+        self._fired: Optional[asyncio.Queue] = None
+        # Symbols fetched but not evaluated yet, and alerts evaluated but not yet removed:
+        # neither may be picked up again by an earlier stage meanwhile
+        self._evaluating: Set[str] = set()
+        self._firing: Set[int] = set()
+        # Marks of evaluated quotes not yet written to the DB (sharded only)
+        self._marks: Dict[str, Tuple[int, float, float]] = {}
+        self._fetcher: Optional[asyncio.Task] = None
+        self._consumers: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return self._fetcher is not None
+
+    def depths(self) -> Dict[Tuple[str], int]:
+        """Items waiting in front of each stage"""
+        if self._quotes is None:
+            return {('evaluate',): 0, ('deliver',): 0}
+        return {('evaluate',): self._quotes.qsize(), ('deliver',): self._fired.qsize()}
+
+    def start(self):
+        """Start all stages; fetch cycles run until stop()"""
+        self._start_consumers()
+        if self._fetcher is None:
+            self._fetcher = asyncio.create_task(self._fetch_loop())
+
+    async def stop(self):
+        """Stop fetching, let quotes already fetched run through, then stop the other stages"""
+        if self._fetcher is not None:
+            self._fetcher.cancel()
+            await asyncio.gather(self._fetcher, return_exceptions=True)
+            self._fetcher = None
+        if self._consumers:
+            await self.drain()
+        # Whoever takes our symbols over continues from these
+        await self._save_marks()
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+        self._consumers = []
+
+    async def drain(self):
+        """Wait until everything fetched so far has been evaluated and delivered"""
+        await self._quotes.join()
+        await self._fired.join()
+
+    async def run_cycle(self):
+        """Run one fetch cycle and wait for its results to pass every stage"""
+        self._start_consumers()
+        await self._fetch_cycle()
+        await self.drain()
+
+    def _start_consumers(self):
+        if not self._consumers:
+            self._quotes = asyncio.Queue(maxsize=self.queue_size)
+            self._fired = asyncio.Queue(maxsize=self.queue_size)
+            self._consumers = [
+                asyncio.create_task(self._evaluate_loop()),
+                asyncio.create_task(self._deliver_loop()),
+            ]
+
+    async def _fetch_loop(self):
+        loop = asyncio.get_running_loop()
+        next_run = loop.time()
+        while True:
+            # Fetch lag: how late this cycle starts against its schedule
+            metrics.PIPELINE_LAG_SECONDS.observe(max(0.0, loop.time() - next_run), labels=('fetch',))
+            next_run = max(next_run + self.interval, loop.time())
+            if self.is_open():
+                try:
+                    await self._fetch_cycle()
+                except Exception as e:
+                    logger.error(f"Error in fetch cycle: {e}")
+            await asyncio.sleep(max(0.0, next_run - loop.time()))
+
+    async def _fetch_cycle(self):
+        started = time.perf_counter()
+
+        # Symbols come straight from the resident index - no table scan
+        # Example: If 5 users have HPG alerts, we only fetch HPG price once
+        unique_symbols = self.db.index.symbols()
+        if self.owns is not None:
+            unique_symbols = [symbol for symbol in unique_symbols if self.owns(symbol)]
+            # Other workers evaluate the rest; their armed alert ids would only pile up here
+            self.db.index.retain_armed(unique_symbols)
+        if not unique_symbols:
+            logger.debug("No alerts to check")
+            return
+
+        # Only symbols whose price may be near a target are due this cycle;
+        # new or edited alerts make their symbol due right away
+        due_symbols = [
+            symbol for symbol in self.poll_scheduler.due(unique_symbols, self.db.index.take_dirty())
+            if symbol not in self._evaluating
+        ]
+        if not due_symbols:
+            logger.debug("No symbols due for a price check")
+            return
+
+        logger.info(f"📊 Fetching prices for {len(due_symbols)}/{len(unique_symbols)} unique symbols "
+                    f"({len(self.db.index)} alerts)...")
+
+        if self.owns is not None:
+            # Publish our marks, then pick up newer ones from workers that polled these symbols
+            await self._save_marks()
+            self.price_checker.merge_marks(await self.db.get_marks(due_symbols))
+
+        # Stream prices - each quote goes on to evaluation as soon as it lands, so fast
+        # symbols don't wait for the slowest one, and a full queue pauses fetching
+        fetched = 0
+        async for symbol, quote in self.price_checker.iter_quotes(due_symbols):
+            if quote is None or not quote.price:
+                logger.warning(f"❌ No price data for {symbol}, skipping alerts")
+                continue
+            self._evaluating.add(symbol)
+            await self._quotes.put((symbol, quote, time.monotonic()))
+            fetched += 1
+
+        metrics.CHECK_CYCLE_SECONDS.observe(time.perf_counter() - started)
+        stats = self.price_checker.cache_stats()
+        logger.info(
+            f"✅ Fetch cycle complete. {fetched} quotes "
+            f"(cache: {stats['hits']} hits, {stats['misses']} misses, {stats['coalesced']} coalesced)"
+        )
+
+    async def _evaluate_loop(self):
+        while True:
+            symbol, quote, queued_at = await self._quotes.get()
+            try:
+                metrics.PIPELINE_LAG_SECONDS.observe(time.monotonic() - queued_at, labels=('evaluate',))
+                fired = self._evaluate(symbol, quote)
+                if fired:
+                    await self._fired.put((symbol, fired, time.monotonic()))
+            except Exception as e:
+                logger.error(f"Error evaluating alerts for {symbol}: {e}")
+            finally:
+                self._evaluating.discard(symbol)
+                self._quotes.task_done()
+
+    def _evaluate(self, symbol: str, quote: Quote) -> List[Tuple]:
+        # Trigger on the high/low reached since the last poll, not just the last price,
+        # so a spike that touches the target between polls isn't missed. Alerts new or edited
+        # since the last poll only count the current price: the spike may predate them.
+        # Two-sided sorted targets: alerts above fire up to the high, alerts below down to the low
+        fired = [
+            (alert_id, chat_id, symbol, target_price, direction, self.render(symbol, direction, target_price, quote))
+            for alert_id, chat_id, target_price, direction
+            in self.db.index.triggered(symbol, quote.high, quote.low, quote.price)
+            if alert_id not in self._firing
+        ]
+        self._firing.update(alert[0] for alert in fired)
+        if self.owns is not None:
+            self._marks.update(self.price_checker.get_marks([symbol]))
+
+        # Next poll comes sooner the closer the price is to the next unfired target
+        self.poll_scheduler.plan(
+            symbol, quote.price, self.db.index.nearest(symbol, quote.high, quote.low),
+            self.price_checker.cache.peek(symbol)
+        )
+        return fired
+
+    async def _save_marks(self):
+        if self._marks:
+            marks, self._marks = self._marks, {}
+            await self.db.save_marks(marks)
+
+    async def _deliver_loop(self):
+        while True:
+            batch = [await self._fired.get()]
+            # Everything that queued up while the last write ran goes out in one transaction
+            while not self._fired.empty():
+                batch.append(self._fired.get_nowait())
+
+            now = time.monotonic()
+            fired = []
+            for _, alerts, queued_at in batch:
+                metrics.PIPELINE_LAG_SECONDS.observe(now - queued_at, labels=('deliver',))
+                fired.extend(alerts)
+            try:
+                await self._deliver(fired)
+            except Exception as e:
+                logger.error(f"Error delivering {len(fired)} fired alerts: {e}")
+            finally:
+                self._firing.difference_update(alert[0] for alert in fired)
+                for _ in batch:
+                    self._fired.task_done()
+
+    async def _deliver(self, fired: List[Tuple]):
+        # Move fired alerts into the outbox in ONE transaction, so a crash can neither
+        # lose the notification nor fire the alert again. Alerts edited since
+        # evaluation are skipped by the delete and must not be notified
+        removed = await self.db.fire_alerts(fired)
+        metrics.TRIGGERS_FIRED.inc(len(removed))
+
+        # The outbox drainer hands them to the dispatcher, which merges a user's
+        # triggers into one message; each row is deleted once Telegram has it
+        if self.outbox is not None:
+            self.outbox.deliver([(outbox_id, chat_id, text) for outbox_id, (_, chat_id, _, _, _, text) in removed])
+        for _, (_, chat_id, symbol, target_price, _, _) in removed:
+            logger.info(f"✅ Alert triggered: {symbol} @ {target_price} for chat {chat_id}")
@@ -0,0 +1,84 @@
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bars import Bars
+from trading_calendar import day_start
+
+# Trading seconds in a day (9:00-11:30 + 13:00-15:00), the horizon of daily volatility
+SESSION_SECONDS = 4.5 * 3600
+
+# Mean daily range assumed until a symbol has history
+DEFAULT_VOLATILITY = 0.02
+
+
+class PollScheduler:
+    """Decides which symbols are due for a price fetch each check cycle.
+
+    A symbol is polled again after about the time its price needs to cover
+    the distance to its nearest pending target, up or down, at `sigmas`
+    standard moves: with daily volatility v, moving a fraction d takes roughly
+    SESSION_SECONDS * (d / (sigmas * v)) ** 2. A target outside today's
+    price-limit band can't be reached before the next session, so it doesn't
+    count.
+
+    Alerts fire on the session high/low since the previous poll, but that range
+    only widens when the session sets a new extreme. A target inside the range
+    already traded today (e.g. set after a morning spike) can be touched again
+    without moving the high/low, and only a poll that catches the price there
+    sees it - such symbols are polled every `min_interval`.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, limit_band: float, sigmas: float = 3.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.limit_band = limit_band
+        self.sigmas = sigmas
+        # symbol -> monotonic time of the next fetch
+        self._next_due: Dict[str, float] = {}
+
+    def due(self, symbols: List[str], dirty: Iterable[str] = (), now: Optional[float] = None) -> List[str]:
+        """Symbols to fetch now: due, never polled, or with alerts changed since the last poll"""
+        now = time.monotonic() if now is None else now
+        active = set(symbols)
+        for symbol in [s for s in self._next_due if s not in active]:
+            del self._next_due[symbol]
+
+        dirty = set(dirty)
+        return [s for s in symbols if s in dirty or self._next_due.get(s, 0) <= now]
+
+    def interval(self, price: float, targets: Tuple[Optional[float], Optional[float]],
+                 bars: Optional[Bars]) -> float:
+        """Seconds until the next poll, given the nearest (above, below) targets around price"""
+        if price <= 0:
+            return self.max_interval
+
+        above, below = targets
+        if bars is not None:
+            session_start = day_start()
+            if bars.t and bars.t[-1] >= session_start and (
+                    (above is not None and above <= bars.h[-1]) or (below is not None and below >= bars.l[-1])):
+                return self.min_interval
+
+            reference = bars.reference(session_start)
+            if reference:
+                # Beyond today's ceiling / floor price
+                if above is not None and above > reference * (1 + self.limit_band):
+                    above = None
+                if below is not None and below < reference * (1 - self.limit_band):
+                    below = None
+
+        distances = [abs(target - price) / price for target in (above, below) if target is not None]
+        if not distances:
+            return self.max_interval
+
+        volatility = (bars.volatility() if bars is not None else None) or DEFAULT_VOLATILITY
+        seconds = SESSION_SECONDS * (min(distances) / (self.sigmas * volatility)) ** 2
+        return min(self.max_interval, max(self.min_interval, seconds))
+
+    def plan(self, symbol: str, price: float, targets: Tuple[Optional[float], Optional[float]],
+             bars: Optional[Bars], now: Optional[float] = None) -> float:
+        """Schedule the symbol's next poll and return the chosen interval"""
+        now = time.monotonic() if now is None else now
+        interval = self.interval(price, targets, bars)
+        self._next_due[symbol] = now + interval
+        return interval
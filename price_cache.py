@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+
+class PriceCache:
+    """TTL + LRU cache with single-flight coalescing of concurrent misses.
+
+    Concurrent callers missing on the same key share one in-flight fetch task,
+    so a symbol is requested upstream at most once per TTL window. Callers that
+    need newer data pass a tighter max_age; they still join an in-flight fetch.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (fetched_at, value)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # key -> callers awaiting the in-flight fetch
+        self._waiters: Dict[Hashable, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, max_age: Optional[float] = None) -> Optional[Any]:
+        """Return the cached value if younger than max_age (default: the TTL)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > (self.ttl if max_age is None else max_age):
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value even if expired (e.g. to reuse immutable history)"""
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None else None
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting least recently used entries past max_size"""
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]],
+                           max_age: Optional[float] = None) -> Optional[Any]:
+        """Return a fresh cached value, or fetch it once for all concurrent callers.
+
+        max_age=0 always fetches (or joins a fetch already in flight).
+        """
+        value = self.get(key, max_age) if max_age != 0 else None
+        if value is not None:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_fetched(key, t))
+
+        # Shield so one caller timing out doesn't cancel the shared fetch; the
+        # last caller to give up cancels it, so it doesn't hold an upstream slot
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                if not task.done():
+                    task.cancel()
+
+    def _on_fetched(self, key: Hashable, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        value = task.result()
+        if value is not None:  # Don't cache failures
+            self.put(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/coalesced counters for observability"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
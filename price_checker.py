@@ -1,166 +1,263 @@
 import asyncio
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List
-
-import aiohttp
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
 
 import config
+import metrics
+from bars import Bars, Quote
+from fetch_engine import FetchEngine
+from price_cache import PriceCache
+from symbol_directory import SymbolDirectory
+from trading_calendar import day_start
 
 
 class PriceChecker:
     def __init__(self):
-        self.session = None
-        self.valid_symbols_cache = set()
-
-    def init_session(self):
-        """Initialize aiohttp session with headers"""
-        if self.session is None:
-            headers = {
+        self.symbols = SymbolDirectory(negative_ttl=config.SYMBOL_NEGATIVE_TTL)
+        # symbol -> (bar time, session high, session low) at the last observation
+        self._marks: Dict[str, Tuple[int, float, float]] = {}
+        self.cache = PriceCache(ttl=config.PRICE_CACHE_TTL, max_size=config.PRICE_CACHE_SIZE)
+        self.engine = FetchEngine(
+            headers={
                 'Accept': '*/*',
                 'Accept-Language': 'en,en-US;q=0.9,vi;q=0.8',
                 'Origin': 'https://stockchart.vietstock.vn',
                 'Referer': 'https://stockchart.vietstock.vn/',
                 'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/141.0.0.0 Safari/537.36',
-            }
-            self.session = aiohttp.ClientSession(headers=headers)
+            },
+            max_concurrency=config.FETCH_MAX_CONCURRENCY,
+            max_retries=config.FETCH_MAX_RETRIES,
+            timeout=config.FETCH_TIMEOUT,
+        )
+
+    def init_session(self):
+        """Initialize pooled aiohttp session with headers"""
+        self.engine.init_session()
 
     async def close_session(self):
         """Close aiohttp session"""
-        if self.session:
-            await self.session.close()
+        await self.engine.close()
 
-    async def get_price(self, symbol: str) -> Optional[float]:
-        """Get current stock price from Vietstock API"""
+    async def _fetch_bars(self, symbol: str) -> Optional[Bars]:
+        """Fetch daily bars for a symbol, downloading only what isn't stored yet"""
+        started = time.perf_counter()
         try:
-            self.init_session()
-
             # Vietstock API endpoint
             url = config.VIETSTOCK_API_URL
 
-            # Get last 2 days of data
-            to_timestamp = int(datetime.now().timestamp())
-            from_timestamp = int((datetime.now() - timedelta(days=7)).timestamp())
+            now = datetime.now(timezone.utc)
+            to_timestamp = int(now.timestamp())
+
+            # Closed daily bars never change: when we already hold them (even in an
+            # expired cache entry), only ask for the window after the newest one
+            known = self.cache.peek(symbol)
+            closed_until = known.closed_until(day_start(now)) if known else None
+
+            if closed_until is not None:
+                from_timestamp = closed_until + 1
+                countback = max(1, (to_timestamp - closed_until) // 86400 + 1)
+            else:
+                # First fetch: seed enough history for the local store
+                from_timestamp = int((now - timedelta(days=config.BAR_HISTORY_SIZE * 2)).timestamp())
+                countback = config.BAR_HISTORY_SIZE
 
             params = {
-                'symbol': symbol.upper(),
+                'symbol': symbol,
                 'resolution': '1D',
                 'from': from_timestamp,
                 'to': to_timestamp,
-                'countback': 7
+                'countback': countback
             }
 
-            async with self.session.get(url, params=params, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
+            data = await self.engine.get_json(url, params)
+            if data is None:
+                return None
 
-                    # Vietstock returns: {c: [prices], o: [opens], h: [highs], l: [lows], v: [volumes], t: [timestamps]}
-                    if data and 'c' in data and len(data['c']) > 0:
-                        # Get the latest closing price (last item in array)
-                        latest_price = data['c'][-1]
+            # Vietstock returns: {c: [prices], o: [opens], h: [highs], l: [lows], v: [volumes], t: [timestamps]}
+            bars = Bars.from_json(symbol, data)
+            if bars is None:
+                if closed_until is not None:
+                    # No bar since the last close (weekend/holiday) - stored history is current
+                    return known
+                # The upstream answered but has no history: not a traded symbol
+                self.symbols.learn(symbol, False)
+                print(f"🔍 DEBUG: Full response = {data}")
+                return None
 
-                        if latest_price:
-                            return float(latest_price)  # Already in thousands
-                    else:
-                        print(f"🔍 DEBUG: Full response = {data}")
-                else:
-                    text = await response.text()
-                    print(f"🔍 DEBUG: Error response: {text[:200]}")
+            self.symbols.learn(symbol, True)
 
-                return None
+            if closed_until is not None:
+                bars = known.merged(bars, keep=config.BAR_HISTORY_SIZE)
+            return bars
         except Exception as e:
-            print(f"Error getting price for {symbol}: {e}")
+            print(f"Error getting bars for {symbol}: {e}")
             return None
+        finally:
+            metrics.FETCH_SECONDS.observe(time.perf_counter() - started)
 
-    async def get_multiple_prices(self, symbols: List[str]) -> Dict[str, float]:
-        """Get prices for multiple symbols efficiently using parallel request"""
-        if not symbols:
-            return {}
+    async def get_bars(self, symbol: str, max_age: Optional[float] = None) -> Optional[Bars]:
+        """Get daily bars through the shared cache - every price consumer derives from this"""
+        symbol = symbol.upper()
+        return await self.cache.get_or_fetch(symbol, lambda: self._fetch_bars(symbol), max_age)
 
-        self.init_session()
+    async def get_fresh_bars(self, symbol: str) -> Optional[Bars]:
+        """Fetch bars now, sharing a fetch already in flight but never a cached result"""
+        return await self.get_bars(symbol, max_age=0)
 
-        # Remove duplicates and convert to uppercase
-        unique_symbols = list(set([s.upper() for s in symbols]))
+    def cache_stats(self) -> Dict:
+        """Expose price cache counters"""
+        return self.cache.stats()
+
+    async def get_price(self, symbol: str) -> Optional[float]:
+        """Get current stock price from Vietstock API"""
+        bars = await self.get_bars(symbol)
+        if bars is None:
+            return None
 
-        print(f"🔄 Fetching prices for {len(unique_symbols)} symbols in parallel...")
+        # Latest closing price, already in thousands
+        return bars.close or None
 
-        # Create tasks for parallel execution
-        tasks = [self.get_price(symbol) for symbol in unique_symbols]
+    async def _iter_completed(self, symbols: List[str], fetch) -> AsyncIterator[Tuple[str, Optional[Any]]]:
+        """Run fetch(symbol) for each symbol, yielding (symbol, result) as each completes"""
+        # Remove duplicates and convert to uppercase
+        unique_symbols = iter(dict.fromkeys(s.upper() for s in symbols))
+        pending: Dict[asyncio.Future, str] = {}
 
+        def top_up():
+            # Only start as many fetches as the limiter admits right now (AIMD may
+            # have cut it), so the per-symbol deadline measures the request itself
+            # rather than time spent queued
+            while len(pending) < max(1, int(self.engine.limiter.limit)):
+                symbol = next(unique_symbols, None)
+                if symbol is None:
+                    break
+                task = asyncio.ensure_future(
+                    asyncio.wait_for(fetch(symbol), timeout=config.FETCH_SYMBOL_TIMEOUT)
+                )
+                pending[task] = symbol
+
+        top_up()
         try:
-            results = await asyncio.wait_for(
-                asyncio.gather(*tasks, return_exceptions=True),
-                timeout=15.0  # Max 15s cho toàn bộ batch
-            )
-        except asyncio.TimeoutError:
-            print(f"⚠️  Batch fetch timeout after 15s")
+            while pending:
+                done, _ = await asyncio.wait(pending.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    symbol = pending.pop(task)
+                    error = 'cancelled' if task.cancelled() else task.exception()
+                    if error is not None:
+                        if isinstance(error, asyncio.TimeoutError):
+                            error = 'timeout'
+                        print(f"⚠️  Failed to get price for {symbol}: {error}")
+                        yield symbol, None
+                    else:
+                        yield symbol, task.result()
+                top_up()
+        finally:
+            # Consumer stopped early - the cache cancels a fetch nobody else waits for
+            for task in pending:
+                task.cancel()
+
+    async def iter_prices(self, symbols: List[str]) -> AsyncIterator[Tuple[str, Optional[float]]]:
+        """Yield (symbol, price) as each fetch completes; price is None on failure/timeout"""
+        async for symbol, price in self._iter_completed(symbols, self.get_price):
+            yield symbol, price
+
+    async def iter_quotes(self, symbols: List[str]) -> AsyncIterator[Tuple[str, Optional[Quote]]]:
+        """Like iter_prices, but each Quote also carries the range traded since the last poll"""
+        # The poll scheduler already decided these are due: a cached result
+        # from up to a TTL ago would delay triggers by a whole cycle
+        async for symbol, bars in self._iter_completed(symbols, self.get_fresh_bars):
+            yield symbol, self.observe(bars) if bars is not None else None
+
+    def observe(self, bars: Bars) -> Quote:
+        """Turn the latest bars into a Quote covering the range traded since the previous observation.
+
+        The live daily bar's high/low are running session extremes: if the high
+        rose since we last looked, the price touched that new high in between
+        polls even if it has fallen back since. Otherwise the best we know is
+        the current price.
+        """
+        t, session_high, session_low, price = bars.t[-1], bars.h[-1], bars.l[-1], bars.c[-1]
+
+        mark = self._marks.get(bars.symbol)
+        if mark is not None and mark[0] == t:
+            high = session_high if session_high > mark[1] else price
+            low = session_low if session_low < mark[2] else price
+        else:
+            # First look at this session - earlier extremes may predate the alerts
+            high = low = price
+
+        self._marks[bars.symbol] = (t, session_high, session_low)
+        return Quote(bars.symbol, price, max(high, price), min(low, price))
+
+    def get_marks(self, symbols: Iterable[str]) -> Dict[str, Tuple[int, float, float]]:
+        """(bar time, session high, session low) of the last observation of each symbol"""
+        return {symbol: self._marks[symbol] for symbol in symbols if symbol in self._marks}
+
+    def merge_marks(self, marks: Dict[str, Tuple[int, float, float]]):
+        """Adopt observations made elsewhere, e.g. by the worker that polled a symbol before.
+
+        Within one session the lower high and higher low win: the range since
+        that mark covers whatever either observer has not evaluated yet.
+        """
+        for symbol, (t, high, low) in marks.items():
+            mark = self._marks.get(symbol)
+            if mark is None or mark[0] < t:
+                self._marks[symbol] = (t, high, low)
+            elif mark[0] == t:
+                self._marks[symbol] = (t, min(high, mark[1]), max(low, mark[2]))
+
+    async def get_multiple_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """Get prices for multiple symbols, keeping every price that arrives in time"""
+        if not symbols:
             return {}
 
-        # Build result dictionary
+        print(f"🔄 Fetching prices for {len(set(s.upper() for s in symbols))} symbols in parallel...")
+
         prices = {}
-        success_count = 0
-        for symbol, result in zip(unique_symbols, results):
-            if not isinstance(result, Exception) and result is not None:
-                prices[symbol] = result
-                success_count += 1
+        failed = 0
+        async for symbol, price in self.iter_prices(symbols):
+            if price is not None:
+                prices[symbol] = price
             else:
-                error_msg = str(result) if isinstance(result, Exception) else 'No data'
-                print(f"⚠️  Failed to get price for {symbol}: {error_msg}")
+                failed += 1
 
-        print(f"✅ Successfully fetched {success_count}/{len(unique_symbols)} prices")
+        print(f"✅ Successfully fetched {len(prices)}/{len(prices) + failed} prices")
         return prices
 
     async def validate_symbol(self, symbol: str) -> bool:
-        """Check if a stock symbol is valid"""
-        price = await self.get_price(symbol)
-        return price is not None
+        """Check if a stock symbol is valid, from the symbol directory when it knows"""
+        known = self.symbols.lookup(symbol)
+        if known is not None:
+            return known
+        # Not seen yet: one fetch settles it (and warms the price cache)
+        return await self.get_bars(symbol) is not None
 
-    async def get_stock_info(self, symbol: str) -> Optional[Dict]:
-        """Get detailed stock information from Vietstock API"""
-        try:
-            self.init_session()
+    async def fetch_symbol_list(self) -> Optional[List[str]]:
+        """Download the exchange listing from SYMBOL_LIST_URL, if one is configured.
 
-            url = config.VIETSTOCK_API_URL
+        Accepts a JSON list of tickers or of objects with a symbol/code field,
+        optionally wrapped in {"data": [...]}.
+        """
+        if not config.SYMBOL_LIST_URL:
+            return None
 
-            to_timestamp = int(datetime.now().timestamp())
-            from_timestamp = int((datetime.now() - timedelta(days=7)).timestamp())
+        data = await self.engine.get_json(config.SYMBOL_LIST_URL, {})
+        if isinstance(data, dict):
+            data = data.get('data')
+        if not isinstance(data, list):
+            print(f"⚠️  Unexpected symbol list payload from {config.SYMBOL_LIST_URL}")
+            return None
 
-            params = {
-                'symbol': symbol.upper(),
-                'resolution': '1D',
-                'from': from_timestamp,
-                'to': to_timestamp,
-                'countback': 7
-            }
+        symbols = []
+        for item in data:
+            if isinstance(item, dict):
+                item = item.get('symbol') or item.get('code') or item.get('Code') or item.get('StockCode')
+            if isinstance(item, str) and item.strip():
+                symbols.append(item.strip().upper())
+        return symbols or None
 
-            async with self.session.get(url, params=params, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-
-                    # Vietstock format: {c: close, o: open, h: high, l: low, v: volume, t: time}
-                    if data and 'c' in data and len(data['c']) > 0:
-                        # Get latest data (last item in each array)
-                        close_price = data['c'][-1]
-                        open_price = data['o'][-1]
-                        high_price = data['h'][-1]
-                        low_price = data['l'][-1]
-                        volume = data['v'][-1]
-
-                        # Calculate change
-                        change = close_price - open_price
-                        change_percent = (change / open_price * 100) if open_price else 0
-
-                        return {
-                            'symbol': symbol.upper(),
-                            'price': float(close_price),
-                            'change': float(change),
-                            'change_percent': float(change_percent),
-                            'volume': int(volume),
-                            'high': float(high_price),
-                            'low': float(low_price),
-                        }
-                return None
-        except Exception as e:
-            print(f"Error getting info for {symbol}: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+    async def get_stock_info(self, symbol: str) -> Optional[Dict]:
+        """Get detailed stock information from Vietstock API"""
+        bars = await self.get_bars(symbol)
+        return bars.info() if bars is not None else None
@@ -0,0 +1,155 @@
+import asyncio
+import bisect
+import hashlib
+import time
+from typing import List, Optional, Sequence
+
+WORKER_LEASE = 'worker:'
+TELEGRAM_LEASE = 'telegram'
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring: maps symbols to workers so a membership change moves ~1/N of them"""
+
+    def __init__(self, members: Sequence[str], vnodes: int = 64):
+        self.members = sorted(members)
+        points = sorted((_hash(f'{member}#{i}'), member) for member in self.members for i in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, symbol: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        pos = bisect.bisect(self._keys, _hash(symbol)) % len(self._keys)
+        return self._owners[pos]
+
+
+class ShardCoordinator:
+    """Splits the polling workload between worker processes sharing one SQLite DB.
+
+    Every worker holds a lease row renewed each `heartbeat`; the live leases
+    form a consistent hash ring and each worker polls only the symbols it
+    owns. Alert writes from other processes reach this worker's index through
+    the alert change log, replayed every `sync_interval`.
+
+    Ownership changes don't rely on the old and new owner overlapping: each
+    worker stores the session high/low it last evaluated per symbol in the
+    DB, and a new owner starts from that mark, so a spike between the old
+    owner's last poll and the new owner's first one is still evaluated. A
+    worker keeps polling symbols it just lost for one lease TTL, and one
+    shutting down keeps polling for one heartbeat after giving up its lease,
+    which shortens the time no one polls. While both poll, the atomic DELETE
+    in fire_alerts lets only one of them move an alert to the outbox. A
+    worker that crashes is replaced once its lease expires; its successor
+    continues from the marks it last saved.
+    """
+
+    def __init__(self, db, worker_id: str, heartbeat: float = 5, sync_interval: float = 1,
+                 change_retention: float = 3600):
+        self.db = db
+        self.worker_id = worker_id
+        self.heartbeat = heartbeat
+        self.lease_ttl = heartbeat * 3
+        self.sync_interval = sync_interval
+        self.change_retention = change_retention
+        self.ring = HashRing([worker_id])
+        # Previous ring, still honoured until handoff_until
+        self._previous: Optional[HashRing] = None
+        self._handoff_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def owns(self, symbol: str) -> bool:
+        """Whether this worker should poll symbol now"""
+        if self.ring.owner(symbol) == self.worker_id:
+            return True
+        return (self._previous is not None and time.monotonic() < self._handoff_until
+                and self._previous.owner(symbol) == self.worker_id)
+
+    def members(self) -> List[str]:
+        return self.ring.members
+
+    async def start(self):
+        """Join the ring before the first poll, then keep the lease and index fresh"""
+        await self._heartbeat()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Leave the ring, and keep polling until the others have noticed and taken over"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.db.release_lease(WORKER_LEASE + self.worker_id, self.worker_id)
+        await asyncio.sleep(self.heartbeat + self.sync_interval)
+
+    async def _heartbeat(self):
+        if not await self.db.acquire_lease(WORKER_LEASE + self.worker_id, self.worker_id, self.lease_ttl):
+            print(f"⚠️  Worker lease {self.worker_id} is held by another process - is WORKER_ID unique?")
+        members = await self.db.live_leases(WORKER_LEASE)
+        if self.worker_id not in members:
+            members.append(self.worker_id)
+        if sorted(members) != self.ring.members:
+            print(f"🔀 Shard membership: {', '.join(sorted(members))}")
+            self._previous = self.ring
+            self._handoff_until = time.monotonic() + self.lease_ttl
+            self.ring = HashRing(members)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_heartbeat = loop.time() + self.heartbeat
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                await self.db.sync_index()
+                if loop.time() >= next_heartbeat:
+                    next_heartbeat = loop.time() + self.heartbeat
+                    await self._heartbeat()
+                    await self.db.prune_changes(self.change_retention)
+            except Exception as e:
+                print(f"Error in shard coordinator: {e}")
+
+
+class TelegramLease:
+    """Makes sure exactly one process polls Telegram for updates"""
+
+    def __init__(self, db, holder: str, heartbeat: float = 5, on_lost=None):
+        self.db = db
+        self.holder = holder
+        self.heartbeat = heartbeat
+        self.on_lost = on_lost
+        self._task: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> bool:
+        """Take the lease; False while another live process holds it"""
+        if not await self.db.acquire_lease(TELEGRAM_LEASE, self.holder, self.heartbeat * 3):
+            return False
+        if self._task is None:
+            self._task = asyncio.create_task(self._renew())
+        return True
+
+    async def release(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.db.release_lease(TELEGRAM_LEASE, self.holder)
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            try:
+                renewed = await self.db.acquire_lease(TELEGRAM_LEASE, self.holder, self.heartbeat * 3)
+            except Exception as e:
+                print(f"Error renewing Telegram lease: {e}")
+                continue
+            if not renewed:
+                print("❌ Lost the Telegram lease to another process")
+                self._task = None
+                if self.on_lost is not None:
+                    self.on_lost()
+                return
@@ -0,0 +1,70 @@
+import time
+from typing import Dict, Iterable, Optional, Set
+
+
+class SymbolDirectory:
+    """In-memory set of known tickers, answering validation without a network call.
+
+    Valid symbols come from the persisted directory table, an optional
+    exchange listing, and every successful fetch. Symbols the upstream has no
+    data for are remembered as invalid for `negative_ttl` seconds, so a typo
+    costs one request rather than one per command. Once a full listing has
+    been loaded the directory is authoritative: anything not in it is invalid.
+    """
+
+    def __init__(self, negative_ttl: float = 3600):
+        self.negative_ttl = negative_ttl
+        self.authoritative = False
+        self._valid: Set[str] = set()
+        # symbol -> monotonic time the negative entry expires
+        self._invalid: Dict[str, float] = {}
+        # Learned since the last take_new(), still to be persisted
+        self._new: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._valid)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self._valid
+
+    def load(self, symbols: Iterable[str], authoritative: bool = False):
+        """Add known symbols; an authoritative listing replaces the set instead"""
+        symbols = {s.strip().upper() for s in symbols if s and s.strip()}
+        if authoritative:
+            self._new &= symbols
+            self._valid = symbols
+            self.authoritative = True
+        else:
+            self._valid |= symbols
+        for symbol in symbols:
+            self._invalid.pop(symbol, None)
+
+    def lookup(self, symbol: str) -> Optional[bool]:
+        """True if known, False if known bad, None if it has to be checked upstream"""
+        symbol = symbol.upper()
+        if symbol in self._valid:
+            return True
+
+        expires_at = self._invalid.get(symbol)
+        if expires_at is not None:
+            if expires_at > time.monotonic():
+                return False
+            del self._invalid[symbol]
+
+        return False if self.authoritative else None
+
+    def learn(self, symbol: str, valid: bool):
+        """Record what a fetch told us about a symbol"""
+        symbol = symbol.upper()
+        if valid:
+            if symbol not in self._valid:
+                self._valid.add(symbol)
+                self._new.add(symbol)
+            self._invalid.pop(symbol, None)
+        elif symbol not in self._valid:
+            self._invalid[symbol] = time.monotonic() + self.negative_ttl
+
+    def take_new(self) -> Set[str]:
+        """Return and reset the symbols learned since the last call"""
+        new, self._new = self._new, set()
+        return new
@@ -0,0 +1,105 @@
+import bisect
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+VN_TZ = timezone(timedelta(hours=7))
+
+# HOSE sessions (Vietnam time). Prices can move from the ATO open until the
+# ATC close; put-through keeps the window open until 15:00 for late prints.
+SESSIONS = (
+    ('ATO', time(9, 0), time(9, 15)),
+    ('continuous', time(9, 15), time(11, 30)),
+    ('continuous', time(13, 0), time(14, 30)),
+    ('ATC', time(14, 30), time(14, 45)),
+    ('put-through', time(14, 45), time(15, 0)),
+)
+
+# Longest run of closed days to search through (Tet + weekends is ~9)
+MAX_CLOSED_DAYS = 30
+
+
+def day_start(now: Optional[datetime] = None) -> int:
+    """Unix timestamp of today's 00:00 Vietnam time; older daily bars are closed"""
+    now = now or datetime.now(VN_TZ)
+    midnight = datetime.combine(now.astimezone(VN_TZ).date(), time(), VN_TZ)
+    return int(midnight.timestamp())
+
+
+def parse_holidays(values: Iterable[str]) -> List[date]:
+    """Parse YYYY-MM-DD strings, skipping malformed entries"""
+    holidays = []
+    for value in values:
+        try:
+            holidays.append(date.fromisoformat(value.strip()))
+        except ValueError:
+            print(f"Ignoring invalid holiday date: {value!r}")
+    return holidays
+
+
+class TradingCalendar:
+    """Trading days and session boundaries, precomputed as Unix timestamps per day.
+
+    Lookups are a bisect over the day's session opens, so checking whether the
+    market is open costs no parsing or datetime arithmetic.
+    """
+
+    def __init__(self, holidays: Iterable[date] = (), sessions=SESSIONS):
+        self.holidays = frozenset(holidays)
+        self.sessions = sessions
+        # (day, session opens, session closes, session names), replaced atomically
+        self._today: Tuple[Optional[date], List[int], List[int], List[str]] = (None, [], [], [])
+
+    def is_trading_day(self, day: date) -> bool:
+        return day.weekday() < 5 and day not in self.holidays
+
+    def _day(self, day: date) -> Tuple[Optional[date], List[int], List[int], List[str]]:
+        cached = self._today
+        if cached[0] == day:
+            return cached
+
+        opens, closes, names = [], [], []
+        if self.is_trading_day(day):
+            for name, start, end in self.sessions:
+                opens.append(int(datetime.combine(day, start, VN_TZ).timestamp()))
+                closes.append(int(datetime.combine(day, end, VN_TZ).timestamp()))
+                names.append(name)
+        cached = (day, opens, closes, names)
+        self._today = cached
+        return cached
+
+    def session_at(self, now: Optional[datetime] = None) -> Optional[str]:
+        """Name of the session in progress, or None when the market is closed"""
+        now = now or datetime.now(VN_TZ)
+        _, opens, closes, names = self._day(now.astimezone(VN_TZ).date())
+        ts = now.timestamp()
+        pos = bisect.bisect_right(opens, ts) - 1
+        if pos >= 0 and ts < closes[pos]:
+            return names[pos]
+        return None
+
+    def is_open(self, now: Optional[datetime] = None) -> bool:
+        return self.session_at(now) is not None
+
+    def windows(self, day: date) -> List[Tuple[datetime, datetime]]:
+        """Polling windows of a day: back-to-back sessions merged into one"""
+        _, opens, closes, _ = self._day(day)
+        merged: List[List[int]] = []
+        for start, end in zip(opens, closes):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [
+            (datetime.fromtimestamp(start, VN_TZ), datetime.fromtimestamp(end, VN_TZ))
+            for start, end in merged
+        ]
+
+    def next_window(self, now: Optional[datetime] = None) -> Optional[Tuple[datetime, datetime]]:
+        """The window in progress, else the next one to open"""
+        now = now or datetime.now(VN_TZ)
+        day = now.astimezone(VN_TZ).date()
+        for offset in range(MAX_CLOSED_DAYS + 1):
+            for start, end in self.windows(day + timedelta(days=offset)):
+                if now < end:
+                    return start, end
+        return None
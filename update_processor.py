@@ -0,0 +1,64 @@
+import asyncio
+import sys
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Handles updates concurrently, but one at a time per chat.
+
+    Up to `max_concurrent_updates` updates run at once, so one user's slow
+    /alert no longer holds up everyone else's /list. Updates from the same
+    chat wait for each other and run in the order they arrived, so /alert
+    followed by /edit can't be reordered. Updates without a chat run freely.
+
+    An update waits for its chat's turn before it takes a slot, so a burst
+    from one chat can't occupy every slot while only one of them may run.
+    PTB's own semaphore, taken before do_process_update, is left unbounded
+    for that reason; the limit is enforced here.
+    """
+
+    __slots__ = ('_slots', '_chats')
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        super().__init__(sys.maxsize)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        # chat_id -> FIFO of turns, head is running or about to; dropped when idle
+        self._chats: Dict[int, Deque[asyncio.Future]] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            async with self._slots:
+                await coroutine
+            return
+
+        turns = self._chats.get(chat.id)
+        if turns is None:
+            turns = self._chats[chat.id] = deque()
+        turn = asyncio.get_running_loop().create_future()
+        if not turns:
+            turn.set_result(None)
+        turns.append(turn)
+        try:
+            # Wait for the previous update of this chat before taking a slot
+            await turn
+            async with self._slots:
+                await coroutine
+        finally:
+            turns.remove(turn)
+            if not turns:
+                del self._chats[chat.id]
+            elif not turns[0].done():
+                turns[0].set_result(None)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass